@@ -20,6 +20,11 @@ from matplotlib import pyplot as plt
 from matplotlib import cm
 from matplotlib import colors
 
+from fsw_writer import read_peaks
+from fsw_dataset import read_scan
+from fsw_tracestore import open_store
+from fsw_catalog import open_catalog
+
 
 
 """
@@ -44,12 +49,51 @@ def interp_array(N1):  # add interpolated rows and columns to array
     return N3
 
 
-def plot3d(path, interp_factor=0,sphere=True):
+def last_per_position(POINTS):
+    # one point per (el, -az), the last one: a resumed scan measures some
+    # positions again and appends a second row
+    return list({(el, az): (el, az, r) for el, az, r in POINTS}.values())
 
-    files = glob.glob(path+os.sep+'*.txt')
-    POINTS = []
 
+def load_points(path):
+    # (el, -az, max) of every position, from the catalog (max marker), the
+    # peak table, the scan dataset or the trace store of the scan if there
+    # is one, otherwise from the maximum of every trace file
 
+    POINTS = []
+    catalog = open_catalog(path)
+    if catalog is not None:
+        # straight from the index, no trace is read
+        rows = catalog.select(order='time, id', scan=os.path.abspath(path))
+        catalog.close()
+        if rows:
+            return last_per_position((row['el'], -row['az'], row['marker_y']) for row in rows)
+
+    # the peak table has every position, with mode 'both' the dataset and
+    # the trace store only every trace_every-th
+    peaks = read_peaks(path)
+
+    if peaks is not None:
+        for name, date_time, marker_x, marker_y in peaks:
+            split = name.replace('.txt','').split('_')
+            az = float(split[-2])
+            el = float(split[-1])
+            POINTS.append((el, -az, marker_y))
+        return last_per_position(POINTS)
+
+    scan = read_scan(path)
+    if scan is not None:
+        # whole scan as one array
+        R = scan['trace'].max(axis=1)
+        return last_per_position(zip(scan['el'], -scan['az'], R))
+
+    store = open_store(path)
+    if store is not None:
+        # memory-mapped, no file is parsed
+        R = store.traces.max(axis=1)
+        return last_per_position(zip(store.index['el'], -store.index['az'], R))
+
+    files = glob.glob(path+os.sep+'*.txt')
     for file in files:
         split = file.replace('.txt','').split('_')
         az = float(split[-2])
@@ -66,6 +110,13 @@ def plot3d(path, interp_factor=0,sphere=True):
         # -az -> angle of robot is in the other direction
         POINTS.append((el, -az, r))
 
+    return POINTS
+
+
+def plot3d(path, interp_factor=0,sphere=True):
+
+    POINTS = load_points(path)
+
 
 
     # AZ, EL, R = zip(*sorted(POINTS))
@@ -153,25 +204,7 @@ def plot3d(path, interp_factor=0,sphere=True):
 
 def plot2d(path, interp_factor=0,sphere=True):
 
-    files = glob.glob(path+os.sep+'*.txt')
-    POINTS = []
-
-
-    for file in files:
-        split = file.replace('.txt','').split('_')
-        az = float(split[-2])
-        el = float(split[-1])
-
-        trace = np.loadtxt(file, comments='#')
-
-        r = trace.max()
-        # for testing
-        # r = np.cos(az/180*np.pi)*np.sin(el/180*np.pi) # dipole 
-        # r = np.cos(az/180*np.pi)*np.sin(el/180*np.pi) # whale
-
-        # POINTS.append((az, el, r))
-        # -az -> angle of robot is in the other direction
-        POINTS.append((el, -az, r))
+    POINTS = load_points(path)
 
 
 
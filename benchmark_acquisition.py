@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "benchmark_acquisition.py"
+
+Benchmark of FSW.measure(): sweeps per second, latency of the stages (arm,
+sweep wait, transfer, marker, disk write) and transfer throughput for a
+matrix of point count, trace format, transport and sweep synchronization.
+
+Runs against the local simulator (fsw_simulator.py) or an instrument, the
+results are written to a JSON file to compare releases.
+
+    python benchmark_acquisition.py
+    python benchmark_acquisition.py --ip 192.168.0.61 --sweeps 50 --output fsw.json
+    python benchmark_acquisition.py --points 1001 10001 --formats REAL,32 --transports socket
+    python benchmark_acquisition.py --error-check batch  # deferred error check
+
+
+"""
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import datetime
+import numpy as np
+from RsInstrument import RsInstrument
+
+from fsw_simulator import FSWSimulator
+from benchmark_transport import connect
+
+
+STAGES = ['arm', 'sweep', 'transfer', 'marker', 'write']
+BYTES_PER_POINT = {'ASCII': 16, 'REAL,32': 4, 'REAL,64': 8}  # ASCII: about
+
+
+def statistics(values):
+    values = np.asarray(values)
+    return {
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'max': float(values.max()),
+    }
+
+
+def run(fsw, path, n_points, trace_format, sync, n_sweeps):
+    fsw.set_trace_format(trace_format)
+    fsw.sweep_sync = sync
+    fsw.configure([('SWE:POIN', n_points)])
+    fsw.get_parameter()
+    fsw.set_path(path)
+    fsw.measure('warmup_0_0')
+
+    timings = {stage: [] for stage in STAGES}
+    t = time.perf_counter()
+    for i in range(n_sweeps):
+        fsw.measure('bench_{}_0'.format(i))
+        for stage in STAGES:
+            timings[stage].append(fsw.timing.get(stage, 0.0))
+    duration = time.perf_counter() - t
+
+    n_bytes = len(fsw.instr.query_str('TRAC? TRACE1')) + 1 if trace_format == 'ASCII' \
+        else BYTES_PER_POINT[trace_format]*n_points
+    transfer = np.mean(timings['transfer'])
+    return {
+        'points': n_points,
+        'format': trace_format,
+        'sync': sync,
+        'sweeps': n_sweeps,
+        'sweeps_per_s': n_sweeps/duration,
+        'bytes_per_trace': n_bytes,
+        'transfer_MB_per_s': n_bytes/transfer/1e6 if transfer > 0 else None,
+        'stages': {stage: statistics(values) for stage, values in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FSW acquisition benchmark')
+    parser.add_argument('--ip', default=None, help='instrument, default: local simulator')
+    parser.add_argument('--points', type=int, nargs='+', default=[1001, 10001, 100001])
+    parser.add_argument('--formats', nargs='+', default=['ASCII', 'REAL,32'])
+    parser.add_argument('--transports', nargs='+', default=['visa', 'socket'])
+    parser.add_argument('--syncs', nargs='+', default=['opc', 'wai', 'stb'])
+    parser.add_argument('--sweeps', type=int, default=20)
+    parser.add_argument('--sweep-time', type=float, default=0.01, help='simulator sweep time in s')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulator latency in s')
+    parser.add_argument('--error-check', default='command', help="'command', 'batch', 'sweep' or n commands")
+    parser.add_argument('--output', default='benchmark_acquisition.json')
+    args = parser.parse_args()
+    error_check = int(args.error_check) if args.error_check.isdigit() else args.error_check
+
+    simulator = None
+    if args.ip is None:
+        simulator = FSWSimulator(port=0, sweep_time=args.sweep_time, latency=args.latency).start()
+        ip, port = '127.0.0.1', simulator.port
+    else:
+        ip, port = args.ip, 5025
+
+    results = []
+    with tempfile.TemporaryDirectory() as path:
+        for transport in args.transports:
+            fsw = connect(ip, port, transport)
+            fsw.instr.instrument_status_checking = True
+            fsw.set_error_check(error_check)
+            fsw.continuous_sweep(False)
+            fsw.basic_config()
+            idn = fsw.instr.query_str('*IDN?')
+            for n_points in args.points:
+                for trace_format in args.formats:
+                    for sync in args.syncs:
+                        result = run(fsw, path, n_points, trace_format, sync, args.sweeps)
+                        result['transport'] = transport
+                        results.append(result)
+                        stages = result['stages']
+                        print('{:>7} {:>8} {:>6} {:>4}: {:7.1f} sweeps/s, transfer {:7.2f} ms, write {:7.2f} ms'.format(
+                            n_points, trace_format, transport, sync, result['sweeps_per_s'],
+                            stages['transfer']['p50']*1e3, stages['write']['p50']*1e3))
+            fsw.close()
+
+    if simulator is not None:
+        simulator.stop()
+
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'instrument': idn,
+        'simulator': simulator is not None,
+        'simulator_sweep_time': args.sweep_time if simulator is not None else None,
+        'error_check': error_check,
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'RsInstrument': RsInstrument.get_driver_version(),
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print("results written to '{}'".format(os.path.abspath(args.output)))
+
+
+if __name__ == '__main__':
+    main()
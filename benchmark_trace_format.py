@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "benchmark_trace_format.py"
+
+Compares the trace transfer formats ASCII, REAL,32 and REAL,64 of the FSW in
+bytes on the wire and wall time for different numbers of sweep points.
+
+With an IP address the benchmark runs against the instrument (the trace of a
+single sweep is fetched several times per format). Without an IP address only
+the host side is measured: a synthetic trace is encoded like the instrument
+does and decoded like the driver does.
+
+    python benchmark_trace_format.py                  # host side only
+    python benchmark_trace_format.py 192.168.0.61     # with instrument
+
+
+"""
+
+
+import sys
+import time
+import numpy as np
+
+from fswcontrol import FSW, TRACE_FORMATS
+
+
+POINTS = [1001, 10001, 32001, 100001]
+REPEAT = 10
+
+
+def block_header(n_bytes):
+    # IEEE 488.2 definite length block header '#<digits><length>'
+    length = str(n_bytes)
+    return '#{}{}'.format(len(length), length)
+
+
+def encode(trace, trace_format):
+    # what the instrument sends for a trace (including the terminating LF)
+    if trace_format == 'ASCII':
+        return (','.join('{:.9E}'.format(value) for value in trace) + '\n').encode()
+    dtype = '<f4' if trace_format == 'REAL,32' else '<f8'
+    payload = trace.astype(dtype).tobytes()
+    return block_header(len(payload)).encode() + payload + b'\n'
+
+
+def decode(data, trace_format):
+    if trace_format == 'ASCII':
+        return np.array(data.decode().split(','), dtype=np.float32)
+    digits = int(data[1:2])
+    start = 2 + digits
+    length = int(data[2:start])
+    dtype = '<f4' if trace_format == 'REAL,32' else '<f8'
+    return np.frombuffer(data, dtype=dtype, count=length // np.dtype(dtype).itemsize,
+                         offset=start).astype(np.float32)
+
+
+def bench_offline(n_points):
+    x = np.linspace(-4, 4, n_points)
+    trace = (-80 + 60*np.exp(-x**2) + np.random.normal(0, 1, n_points)).astype(np.float32)
+
+    results = []
+    for trace_format in TRACE_FORMATS:
+        data = encode(trace, trace_format)
+        t = time.perf_counter()
+        for _ in range(REPEAT):
+            decode(data, trace_format)
+        duration = (time.perf_counter() - t)/REPEAT
+        results.append((trace_format, len(data), duration))
+    return results
+
+
+def bench_instrument(fsw, n_points):
+    fsw.instr.write_str('SWE:POIN {}'.format(n_points))
+    fsw.instr.write_str_with_opc('INIT')
+
+    results = []
+    for trace_format in TRACE_FORMATS:
+        fsw.set_trace_format(trace_format)
+        if trace_format == 'ASCII':
+            n_bytes = len(fsw.instr.query_str('TRAC? TRACE1')) + 1
+        else:
+            n_bytes = len(fsw.instr.query_bin_block('TRAC? TRACE1'))
+            n_bytes += len(block_header(n_bytes)) + 1
+
+        buffer = np.empty(n_points, dtype=np.float32)
+        t = time.perf_counter()
+        for _ in range(REPEAT):
+            fsw.fetch_trace(1, out=buffer)
+        duration = (time.perf_counter() - t)/REPEAT
+        results.append((trace_format, n_bytes, duration))
+    return results
+
+
+def main(ip=None):
+    fsw = None
+    if ip is not None:
+        fsw = FSW()
+        fsw.ip = ip
+        fsw.init()
+        fsw.continuous_sweep(False)
+
+    print('{:>8} {:>8} {:>12} {:>10} {:>10}'.format('points', 'format', 'bytes', 'ms', 'MB/s'))
+    for n_points in POINTS:
+        if fsw is None:
+            results = bench_offline(n_points)
+        else:
+            results = bench_instrument(fsw, n_points)
+        for trace_format, n_bytes, duration in results:
+            print('{:>8} {:>8} {:>12} {:>10.3f} {:>10.1f}'.format(
+                n_points, trace_format, n_bytes, duration*1e3, n_bytes/duration/1e6))
+
+    if fsw is not None:
+        fsw.set_trace_format('REAL,32')
+        fsw.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
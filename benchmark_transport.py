@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "benchmark_transport.py"
+
+Compares the trace transfer through the driver (RsInstrument, 'visa') with
+the raw socket transport (fsw_socket.SocketInstrument, 'socket').
+
+Without an IP address the local FSW simulator (fsw_simulator.py) is started,
+with sweeps and latency switched off only the transport is measured.
+RsInstrument is connected to it with its socket plugin
+(SelectVisa=socket), no VISA installation is needed.
+
+    python benchmark_transport.py                  # local simulator
+    python benchmark_transport.py 192.168.0.61     # with instrument
+
+
+"""
+
+
+import sys
+import time
+import numpy as np
+
+from fswcontrol import FSW
+from fsw_simulator import FSWSimulator
+
+
+POINTS = [1001, 10001, 100001]
+REPEAT = 20
+
+
+def connect(ip, port, transport):
+    fsw = FSW()
+    fsw.ip = ip
+    fsw.port = port
+    fsw.transport = transport
+    if transport == 'visa' and port != 5025:
+        # simulator: driver with its own socket plugin on the given port
+        fsw.resource = 'TCPIP::{}::{}::SOCKET'.format(ip, port)
+        fsw.visa_options = 'SelectVisa=socket'
+    fsw.init()
+    fsw.instr.instrument_status_checking = False
+    return fsw
+
+
+def bench(fsw, n_points):
+    fsw.instr.write_str('SWE:POIN {}'.format(n_points))
+    fsw.instr.query_opc()
+    buffer = np.empty(n_points, dtype=np.float32)
+    fsw.fetch_trace(1, out=buffer)  # warm up
+
+    t = time.perf_counter()
+    for _ in range(REPEAT):
+        fsw.fetch_trace(1, out=buffer)
+    return (time.perf_counter() - t)/REPEAT
+
+
+def main(ip=None):
+    if ip is None:
+        server = FSWSimulator(port=0, sweep_time=0).start()
+        ip, port = '127.0.0.1', server.port
+    else:
+        server, port = None, 5025
+
+    print('{:>8} {:>8} {:>10} {:>10}'.format('points', 'transport', 'ms', 'MB/s'))
+    for transport in ('visa', 'socket'):
+        fsw = connect(ip, port, transport)
+        for n_points in POINTS:
+            duration = bench(fsw, n_points)
+            print('{:>8} {:>8} {:>10.3f} {:>10.1f}'.format(
+                n_points, transport, duration*1e3, 4*n_points/duration/1e6))
+        fsw.instr.close()
+
+    if server is not None:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
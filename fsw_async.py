@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_async.py"
+
+Asyncio client for the Rohde & Schwarz FSW over a raw SCPI socket (port 5025).
+
+Works next to the FSW class in fswcontrol.py, but nothing blocks: while one
+analyzer sweeps, other analyzers (or a positioner) can be controlled from the
+same thread.
+
+    async def main():
+        fsw1 = AsyncFSW('192.168.0.61')
+        fsw2 = AsyncFSW('192.168.0.62')
+        await asyncio.gather(fsw1.init(), fsw2.init())
+        await asyncio.gather(fsw1.configure(settings), fsw2.configure(settings))
+        await asyncio.gather(fsw1.sweep(), fsw2.sweep())
+        trace1, trace2 = await asyncio.gather(fsw1.fetch_trace(), fsw2.fetch_trace())
+
+    asyncio.run(main())
+
+
+"""
+
+
+import asyncio
+import numpy as np
+
+from fswcontrol import CommandBatch, TRACE_FORMATS
+from fsw_socket import parse_errors
+
+
+class AsyncFSW:
+
+    def __init__(self, ip='192.168.0.61', port=5025):
+
+        self.ip = ip
+        self.port = port
+        self.timeout = 20  # seconds, for queries and opc-synchronised operations
+        self.trace_format = 'REAL,32'
+        # longest line the reader accepts (ASCII trace, 100001 points are
+        # about 2 MB), the default of asyncio is 64 KiB
+        self.read_limit = 32 << 20
+        self.reader = None
+        self.writer = None
+        # one request/response at a time per connection
+        self.lock = asyncio.Lock()
+
+
+    async def init(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.ip, self.port, limit=self.read_limit), self.timeout)
+
+        idn = await self.query('*IDN?')
+        print('Hello, I am: ' + idn)
+
+        await self.set_trace_format(self.trace_format)
+
+
+    async def write(self, cmd):
+        async with self.lock:
+            await self.send(cmd)
+
+
+    async def query(self, query, timeout=None):
+        async with self.lock:
+            await self.send(query)
+            line = await asyncio.wait_for(self.reader.readline(), timeout or self.timeout)
+        return line.decode().strip()
+
+
+    async def send(self, cmd):
+        self.writer.write(cmd.encode() + b'\n')
+        await self.writer.drain()
+
+
+    async def read_block(self, timeout=None):
+        # IEEE 488.2 definite length block '#<digits><length><data>\n'
+        async def read():
+            head = await self.reader.readexactly(2)
+            if head[:1] != b'#':
+                rest = await self.reader.readline()
+                raise RuntimeError('expected a binary block, got {!r}'.format(head + rest))
+            digits = int(head[1:2])
+            if digits == 0:
+                # indefinite length, terminated by the line feed
+                return (await self.reader.readline())[:-1]
+            length = int(await self.reader.readexactly(digits))
+            data = await self.reader.readexactly(length)
+            await self.reader.readexactly(1)  # terminating line feed
+            return data
+
+        return await asyncio.wait_for(read(), timeout or self.timeout)
+
+
+    async def set_trace_format(self, trace_format='REAL,32'):
+        trace_format = trace_format.upper().replace(' ', '')
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError("Unknown trace format '{}', use one of {}".format(
+                trace_format, ', '.join(TRACE_FORMATS)))
+        self.trace_format = trace_format
+        await self.write('FORM {}'.format(TRACE_FORMATS[trace_format][0]))
+
+
+    async def configure(self, settings, max_length=1024):
+        # settings: list of (header, value), chained in as few messages as
+        # possible and synchronized once
+        batch = CommandBatch(max_length)
+        for header, value in settings:
+            batch.add(header, value)
+        async with self.lock:
+            for message in batch.messages():
+                await self.send(message)
+        return await self.query('*OPC?') == '1'
+
+
+    async def sweep(self):
+        # single sweep, returns when the sweep is finished (other coroutines
+        # keep running in the meantime)
+        await self.query('INIT;*OPC?')
+
+
+    async def fetch_trace(self, trace=1, out=None):
+        query = 'TRAC? TRACE{}'.format(trace)
+        if self.trace_format == 'ASCII':
+            values = np.array((await self.query(query)).split(','), dtype=np.float32)
+        else:
+            async with self.lock:
+                await self.send(query)
+                data = await self.read_block()
+            dtype = '<f4' if self.trace_format == 'REAL,32' else '<f8'
+            values = np.frombuffer(data, dtype=dtype)
+
+        if out is None:
+            return values.astype(np.float32)
+        if out.dtype != np.float32 or out.size < values.size:
+            raise ValueError('out has to be a float32 array with at least {} elements'.format(values.size))
+        trace = out[:values.size]
+        np.copyto(trace, values, casting='same_kind')
+        return trace
+
+
+    async def marker_xy(self):
+        # marker to the maximum, both values with one chained query
+        await self.query('CALC1:MARK1:MAX;*OPC?')
+        answer = await self.query('CALC1:MARK1:X?;:CALC1:MARK1:Y?')
+        marker_x, marker_y = answer.split(';')
+        return float(marker_x), float(marker_y)
+
+
+    async def errors(self):
+        # all entries of the error queue as (code, message), empty list if
+        # there are none
+        return parse_errors(await self.query('SYST:ERR:ALL?'))
+
+
+    async def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.reader = self.writer = None
+        print('connection closed')
+
+
+# for testing
+if __name__ == '__main__':
+
+    async def main():
+        fsw = AsyncFSW('192.168.0.62')
+        await fsw.init()
+        await fsw.configure([('FREQ:CENT', '61.0 GHz'), ('FREQ:SPAN', '1000 MHz'), ('SWE:POIN', '1001')])
+        await fsw.sweep()
+        trace = await fsw.fetch_trace()
+        mx, my = await fsw.marker_xy()
+        print(f'{len(trace)} points, Max Marker at {mx} Hz with {my} dB')
+        await fsw.close()
+
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_catalog.py"
+
+SQLite catalog of the measurements (FSW.open_catalog): one row per
+measure() with the location of the trace (text file, or scan dataset / trace
+store and row, empty for peak-only measurements), az and el, time, the
+settings (Parameters) and the max marker. Center frequency, span, points and
+the marker are columns with an index, all other settings are in 'parameters'
+(JSON).
+
+    catalog = MeasurementCatalog('data/FSW_catalog.sqlite')
+    cut = catalog.select(el=0)  # elevation cut
+    runs = catalog.select(f_center=61e9, az=(-30, 30))  # value or range
+
+The catalog can be shared by several scans ('scan' is the scan folder).
+There is one row per scan and name, a position that is measured again
+(resumed scan) replaces its row.
+
+
+"""
+
+
+import os
+import json
+import sqlite3
+
+
+CATALOG = 'FSW_catalog.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    scan TEXT,
+    name TEXT,
+    location TEXT,
+    row INTEGER,
+    az REAL,
+    el REAL,
+    time REAL,
+    f_center REAL,
+    f_span REAL,
+    n_points INTEGER,
+    marker_x REAL,
+    marker_y REAL,
+    parameters TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_position ON measurements (az, el);
+CREATE INDEX IF NOT EXISTS measurements_el ON measurements (el);
+CREATE INDEX IF NOT EXISTS measurements_f_center ON measurements (f_center);
+CREATE INDEX IF NOT EXISTS measurements_time ON measurements (time);
+'''
+
+# catalogs written before the unique index keep the last row of every name
+UNIQUE_NAME = '''
+DELETE FROM measurements WHERE id NOT IN (SELECT MAX(id) FROM measurements GROUP BY scan, name);
+CREATE UNIQUE INDEX measurements_name ON measurements (scan, name);
+'''
+
+COLUMNS = ['id', 'scan', 'name', 'location', 'row', 'az', 'el', 'time', 'f_center', 'f_span',
+           'n_points', 'marker_x', 'marker_y', 'parameters']
+
+
+class MeasurementCatalog:
+
+    def __init__(self, f_path):
+        self.f_path = f_path
+        self.db = sqlite3.connect(f_path)
+        self.db.row_factory = sqlite3.Row
+        # every add is committed, with WAL without waiting for the disk
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        if self.db.execute("SELECT name FROM sqlite_master WHERE name = 'measurements_name'").fetchone() is None:
+            self.db.executescript(UNIQUE_NAME)
+
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM measurements').fetchone()[0]
+
+
+    def add(self, scan, name, location, row, az, el, timestamp, parameters, marker_x, marker_y):
+        # parameters: dict of the settings (dataclasses.asdict(Parameters))
+        parameters = parameters or {}
+        self.db.execute(
+            'INSERT INTO measurements (scan, name, location, row, az, el, time, f_center, f_span, n_points, '
+            'marker_x, marker_y, parameters) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (scan, name) DO UPDATE SET location = excluded.location, row = excluded.row, '
+            'az = excluded.az, el = excluded.el, time = excluded.time, f_center = excluded.f_center, '
+            'f_span = excluded.f_span, n_points = excluded.n_points, marker_x = excluded.marker_x, '
+            'marker_y = excluded.marker_y, parameters = excluded.parameters',
+            (scan, name, location, row, az, el, timestamp, parameters.get('f_center'), parameters.get('f_span'),
+             parameters.get('N_points'), marker_x, marker_y, json.dumps(parameters)))
+        self.db.commit()
+
+
+    def select(self, order='az, el', **filters):
+        # rows (dicts) where every column matches its value, or lies in
+        # (low, high) for a tuple, e.g. select(el=0, az=(-90, 90))
+        where = []
+        values = []
+        for column, value in filters.items():
+            if column not in COLUMNS:
+                raise ValueError("Unknown column '{}'".format(column))
+            if isinstance(value, tuple):
+                where.append('{} BETWEEN ? AND ?'.format(column))
+                values += list(value)
+            else:
+                where.append('{} = ?'.format(column))
+                values.append(value)
+        query = 'SELECT * FROM measurements'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY ' + order
+        rows = []
+        for row in self.db.execute(query, values):
+            row = dict(row)
+            row['parameters'] = json.loads(row['parameters']) if row['parameters'] else {}
+            rows.append(row)
+        return rows
+
+
+    def close(self):
+        self.db.close()
+
+
+def open_catalog(path):
+    # MeasurementCatalog of the scan folder, None if there is none
+    f_path = os.path.join(path, CATALOG)
+    if not os.path.isfile(f_path):
+        return None
+    return MeasurementCatalog(f_path)
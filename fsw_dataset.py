@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_dataset.py"
+
+Scan dataset: all traces of a scan in one HDF5 file instead of one text file
+per position (FSW.open_dataset, measure() appends a row per trace).
+
+    trace       float32 [position, point], chunked
+    frequency   float64 [point], frequency axis of the first row
+    f_start     float64 [position], frequency of the first and last point of
+    f_stop      float64 [position]  the row (zoom, region of interest)
+    az, el      float64 [position], from the name 'xxx_<az>_<el>'
+    time        float64 [position], unix time
+    marker_x    float64 [position]
+    marker_y    float64 [position]
+    name        str [position]
+
+The settings of the first measurement (header of the text files) are
+attributes of the file. Rows are collected on the host and written a chunk
+at a time, the file is flushed after every chunk (flush() and close() write
+the rest). A crash loses the rows that are not written yet, the file stays
+readable. read_scan() returns the whole scan as arrays.
+
+
+"""
+
+
+import os
+import numpy as np
+import h5py
+
+
+DATASET = 'FSW_scan.h5'
+
+COLUMNS = ['f_start', 'f_stop', 'az', 'el', 'time', 'marker_x', 'marker_y']
+
+# labels of the measurement header that are columns and not attributes
+ROW_LABELS = ['File name', 'Date', 'Max Marker X', 'Max Marker Y']
+
+
+def position_of(name):
+    # (az, el) from a file name like 'scan_-90_10.txt', nan if there is none
+    split = os.path.basename(name).replace('.txt', '').split('_')
+    try:
+        return float(split[-2]), float(split[-1])
+    except (ValueError, IndexError):
+        return np.nan, np.nan
+
+
+class ScanDataset:
+
+    def __init__(self, f_path, chunk_bytes=1 << 20):
+        # appends to an existing dataset
+        self.f_path = f_path
+        self.chunk_bytes = chunk_bytes
+        self.file = h5py.File(f_path, 'a', rdcc_nbytes=4*chunk_bytes)
+        self.pending = None  # rows not written yet
+        self.n_pending = 0
+        if 'trace' in self.file:
+            self.new_pending(self.file['trace'].shape[1])
+
+
+    def __len__(self):
+        return (len(self.file['trace']) if 'trace' in self.file else 0) + self.n_pending
+
+
+    def new_pending(self, n_points):
+        rows = self.file['trace'].chunks[0]
+        self.pending = {'trace': np.empty((rows, n_points), dtype=np.float32), 'name': []}
+        for column in COLUMNS:
+            self.pending[column] = np.empty(rows)
+
+
+    def create(self, n_points, freq, header):
+        # datasets of the scan, rows are added with append()
+        rows = max(1, self.chunk_bytes//(4*n_points))
+        self.file.create_dataset('trace', (0, n_points), dtype='f4', maxshape=(None, n_points),
+                                 chunks=(rows, n_points))
+        self.file.create_dataset('frequency', data=np.asarray(freq, dtype='f8'))
+        for column in COLUMNS:
+            self.file.create_dataset(column, (0,), dtype='f8', maxshape=(None,), chunks=(4096,))
+        self.file.create_dataset('name', (0,), dtype=h5py.string_dtype(), maxshape=(None,), chunks=(4096,))
+        for label, value in header:
+            if label not in ROW_LABELS:
+                self.file.attrs[label] = str(value) if value is None else value
+        self.new_pending(n_points)
+
+
+    def append(self, name, trace, freq, timestamp, marker_x, marker_y, header=()):
+        # one trace, freq: frequency axis of the trace
+        if 'trace' not in self.file:
+            self.create(len(trace), freq, header)
+        pending = self.pending
+        if len(trace) != pending['trace'].shape[1]:
+            raise ValueError('trace has {} points, the dataset {}'.format(len(trace), pending['trace'].shape[1]))
+
+        k = self.n_pending
+        az, el = position_of(name)
+        values = {'f_start': freq[0], 'f_stop': freq[-1], 'az': az, 'el': el, 'time': timestamp,
+                  'marker_x': marker_x, 'marker_y': marker_y}
+        pending['trace'][k] = trace
+        for column in COLUMNS:
+            pending[column][k] = values[column]
+        pending['name'].append(name)
+        self.n_pending += 1
+        if self.n_pending == len(pending['trace']):
+            self.write_pending()
+
+
+    def write_pending(self):
+        # one resize and one write per dataset for all pending rows, the
+        # file is flushed so a crash does not leave it unreadable
+        k = self.n_pending
+        if k == 0:
+            return
+        i = len(self.file['trace'])
+        for key in ['trace', 'name'] + COLUMNS:
+            self.file[key].resize(i + k, axis=0)
+            self.file[key][i:i + k] = self.pending[key][:k]
+        self.pending['name'] = []
+        self.n_pending = 0
+        self.file.flush()
+
+
+    def flush(self):
+        self.write_pending()
+
+
+    def close(self):
+        if self.file.id:
+            self.write_pending()
+            self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_scan(f_path):
+    # whole scan: {'trace': [position, point], 'frequency', columns, 'name',
+    # 'attrs'}, None if there is no dataset
+    if os.path.isdir(f_path):
+        f_path = os.path.join(f_path, DATASET)
+    if not os.path.isfile(f_path):
+        return None
+    with h5py.File(f_path, 'r') as file:
+        if 'trace' not in file:
+            return None
+        scan = {key: file[key][()] for key in ['trace', 'frequency'] + COLUMNS}
+        scan['name'] = file['name'].asstr()[()]
+        scan['attrs'] = dict(file.attrs)
+    return scan
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_journal.py"
+
+Write-ahead journal of a scan (FSW.scan): before a position is measured a
+'begin' record and after the trace is written a 'done' record is appended
+to FSW_journal.jsonl (one JSON object per line) and fsync'ed, so the journal
+survives a crash or a dropped connection.
+
+When the scan is started again, verify() checks the traces of the finished
+positions: all rows in the trace store or scan dataset and the text files
+of the last positions (the pipeline writer may not have written them yet).
+Positions with a missing or incomplete trace and the position that was
+begun but not finished are measured again, all others are skipped. A scan
+dataset that cannot be read has no complete rows (FSW.open_dataset moves it
+aside and starts a new one).
+
+
+"""
+
+
+import os
+import json
+import time
+
+import h5py
+
+from fsw_tracestore import STORE_DATA, STORE_META
+
+
+JOURNAL = 'FSW_journal.jsonl'
+
+
+def file_complete(f_path):
+    # True if the text file has as many values as its header says
+    expected = None
+    count = 0
+    try:
+        with open(f_path) as file:
+            for line in file:
+                if line.startswith('#'):
+                    label, _, value = line[1:].partition(':')
+                    if label.strip() in ('Number Points', 'ROI Points'):
+                        expected = int(float(value))
+                elif line.strip():
+                    count += 1
+    except (OSError, ValueError):
+        return False
+    return expected is not None and count == expected
+
+
+def container_rows(location):
+    # number of complete rows in the trace store or scan dataset
+    try:
+        if location.endswith(STORE_DATA):
+            with open(os.path.join(os.path.dirname(location), STORE_META)) as file:
+                n_points = json.load(file)['n_points']
+            return os.path.getsize(location)//(4*n_points)
+        with h5py.File(location, 'r') as file:
+            return len(file['trace'])
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+class ScanJournal:
+
+    def __init__(self, f_path):
+        self.f_path = f_path
+        self.done = {}  # name -> 'done' record
+        self.begun = None  # name of the position that was begun last and not finished
+        self.order = []  # names of the done records in journal order
+        if os.path.isfile(f_path):
+            with open(f_path) as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # last line cut off by the crash
+                    if record['event'] == 'begin':
+                        self.begun = record['name']
+                    elif record['event'] == 'done':
+                        self.done[record['name']] = record
+                        self.order.append(record['name'])
+                        if self.begun == record['name']:
+                            self.begun = None
+                    elif record['event'] == 'redo':
+                        # trace found incomplete by verify()
+                        self.done.pop(record['name'], None)
+        self.order = [name for name in self.order if name in self.done]
+        self.file = open(f_path, 'a')
+
+
+    def __len__(self):
+        return len(self.done)
+
+
+    def write(self, record):
+        record['time'] = time.time()
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+
+    def begin(self, name):
+        self.write({'event': 'begin', 'name': name})
+        self.begun = name
+
+
+    def complete(self, name, az, el, location, row, marker_x, marker_y):
+        record = {'event': 'done', 'name': name, 'az': az, 'el': el, 'location': location, 'row': row,
+                  'marker_x': marker_x, 'marker_y': marker_y}
+        self.write(record)
+        self.done[name] = record
+        self.order.append(name)
+        self.begun = None
+
+
+    def verify(self, check_last=8):
+        # Checks the rows of all finished positions in the trace store or
+        # scan dataset (rows of the dataset are written a chunk at a time)
+        # and the text files of the last check_last positions. Positions
+        # with a missing or incomplete trace are measured again, returns
+        # their names and the name of the position that was begun but not
+        # finished.
+        redo = []
+        last = set(self.order[-check_last:])
+        rows = {}
+        for name, record in list(self.done.items()):
+            location = record['location']
+            if location is None:
+                continue  # peak only, the marker is in the record
+            if record['row'] is not None:
+                if location not in rows:
+                    rows[location] = container_rows(location)
+                complete = record['row'] < rows[location]
+            elif name in last:
+                complete = file_complete(location)
+            else:
+                continue
+            if not complete:
+                # recorded, a later row could have the same index
+                self.write({'event': 'redo', 'name': name})
+                del self.done[name]
+                redo.append(name)
+        if self.begun is not None and self.begun not in self.done:
+            redo.append(self.begun)
+        return redo
+
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_profiling.py"
+
+Opt-in instrumentation of the SCPI traffic of the FSW class.
+
+InstrumentedInstrument wraps FSW.instr (RsInstrument or SocketInstrument) and
+records every write and query with the SCPI header, bytes out and in, wall
+clock and monotonic start time and duration into the ring buffer of a
+ScpiProfiler. Host side stages (e.g. writing the file) can be added as spans.
+The time of the driver's error checking (instrument_status_checking) is part
+of the command it belongs to, 'status_checking' tells if it was on.
+
+    with fsw.profile() as profiler:
+        for az in range(-90, 91, 10):
+            fsw.measure('scan_{}_0'.format(az))
+    profiler.report()  # p50/p95/p99 per command
+    profiler.to_chrome_trace('scan.json')  # chrome://tracing or ui.perfetto.dev
+
+
+"""
+
+
+import json
+import time
+import threading
+import collections
+import numpy as np
+
+
+ScpiRecord = collections.namedtuple('ScpiRecord', [
+    'method', 'header', 'command', 'bytes_out', 'bytes_in', 'wall', 'start', 'duration',
+    'thread', 'status_checking', 'error'])
+
+
+# commands sent by methods without a command argument
+IMPLICIT_COMMANDS = {'query_opc': '*OPC?', 'reset': '*RST', 'clear_status': '*CLS'}
+
+
+def scpi_header(command):
+    # 'FREQ:CENT 61 GHz;:FREQ:SPAN 1 GHz' -> 'FREQ:CENT;FREQ:SPAN'
+    headers = []
+    for part in command.split(';'):
+        part = part.strip().lstrip(':')
+        if part:
+            headers.append(part.split(' ')[0])
+    return ';'.join(headers)
+
+
+class ScpiProfiler:
+
+    def __init__(self, size=100000):
+        self.records = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.wall_zero = time.time()
+        self.zero = time.perf_counter()
+
+
+    def record(self, method, command, bytes_out, bytes_in, start, duration, status_checking=None, error=None):
+        wall = self.wall_zero + (start - self.zero)
+        record = ScpiRecord(method, scpi_header(command), command[:200], bytes_out, bytes_in, wall,
+                            start, duration, threading.get_ident(), status_checking, error)
+        with self.lock:
+            self.records.append(record)
+
+
+    def span(self, name, start, duration):
+        # host side stage, e.g. span('host:write', t, time.perf_counter() - t)
+        self.record('host', name, 0, 0, start, duration)
+
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+
+    def stats(self):
+        # {header: {count, total, mean, p50, p95, p99, max, bytes_out, bytes_in}}
+        with self.lock:
+            records = list(self.records)
+        groups = collections.defaultdict(list)
+        for record in records:
+            groups[record.header].append(record)
+
+        stats = {}
+        for header, group in groups.items():
+            durations = np.array([record.duration for record in group])
+            stats[header] = {
+                'count': len(group),
+                'total': float(durations.sum()),
+                'mean': float(durations.mean()),
+                'p50': float(np.percentile(durations, 50)),
+                'p95': float(np.percentile(durations, 95)),
+                'p99': float(np.percentile(durations, 99)),
+                'max': float(durations.max()),
+                'bytes_out': sum(record.bytes_out or 0 for record in group),
+                'bytes_in': sum(record.bytes_in or 0 for record in group),
+            }
+        return dict(sorted(stats.items(), key=lambda item: -item[1]['total']))
+
+
+    def report(self):
+        stats = self.stats()
+        total = sum(stat['total'] for stat in stats.values()) or 1
+        print('{:<32} {:>7} {:>9} {:>6} {:>9} {:>9} {:>9} {:>11}'.format(
+            'command', 'count', 'total s', '%', 'p50 ms', 'p95 ms', 'p99 ms', 'bytes in'))
+        for header, stat in stats.items():
+            print('{:<32} {:>7} {:>9.3f} {:>6.1f} {:>9.3f} {:>9.3f} {:>9.3f} {:>11}'.format(
+                header[:32], stat['count'], stat['total'], 100*stat['total']/total,
+                stat['p50']*1e3, stat['p95']*1e3, stat['p99']*1e3, stat['bytes_in']))
+
+
+    def to_json(self, f_path):
+        with self.lock:
+            records = [record._asdict() for record in self.records]
+        with open(f_path, 'w') as file:
+            json.dump({'records': records, 'stats': self.stats()}, file, indent=1)
+
+
+    def to_chrome_trace(self, f_path):
+        # Trace Event Format, complete events ('X') in microseconds
+        with self.lock:
+            records = list(self.records)
+        events = []
+        for record in records:
+            events.append({
+                'name': record.header,
+                'cat': record.method,
+                'ph': 'X',
+                'ts': (record.start - self.zero)*1e6,
+                'dur': record.duration*1e6,
+                'pid': 1,
+                'tid': record.thread,
+                'args': {'command': record.command, 'bytes_out': record.bytes_out,
+                         'bytes_in': record.bytes_in, 'error': record.error},
+            })
+        with open(f_path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+def response_size(method, result):
+    # bytes received for the result of a method (approximate for converted
+    # values, None if unknown)
+    if result is None:
+        return 0
+    if method == 'query_bin_block_into':
+        return result
+    if isinstance(result, (bytes, bytearray, memoryview)):
+        length = len(result)
+        return length + 3 + len(str(length))  # '#', digits, length, LF
+    if isinstance(result, str):
+        return len(result) + 1
+    if isinstance(result, (bool, int, float)):
+        return len(str(result)) + 1
+    return None
+
+
+class InstrumentedInstrument:
+    # Proxy for FSW.instr, all write*/query*/reset calls are recorded, all
+    # other attributes are passed through.
+
+    def __init__(self, instr, profiler):
+        object.__setattr__(self, 'instr', instr)
+        object.__setattr__(self, 'profiler', profiler)
+
+
+    def __getattr__(self, name):
+        attribute = getattr(self.instr, name)
+        if not callable(attribute) or not name.startswith(('write', 'query', 'reset', 'clear_status')):
+            return attribute
+
+        profiler = self.profiler
+        instr = self.instr
+
+        def wrapper(*args, **kwargs):
+            command = str(args[0]) if args and isinstance(args[0], str) else IMPLICIT_COMMANDS.get(name, name)
+            status_checking = getattr(instr, 'instrument_status_checking', None)
+            start = time.perf_counter()
+            error = None
+            result = None
+            try:
+                result = attribute(*args, **kwargs)
+                return result
+            except Exception as ex:
+                error = repr(ex)
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                bytes_out = len(command) + 1
+                if name.endswith('_with_opc'):
+                    bytes_out += 6  # ';*OPC?'
+                profiler.record(name, command, bytes_out, response_size(name, result), start, duration,
+                                status_checking, error)
+
+        return wrapper
+
+
+    def __setattr__(self, name, value):
+        setattr(self.instr, name, value)
@@ -0,0 +1,681 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_simulator.py"
+
+Local stand-in for the Rohde & Schwarz FSW on a raw SCPI socket (TCP 5025),
+to test and benchmark fswcontrol.py without an instrument.
+
+Implements the commands used by fswcontrol.py, fsw_async.py and the examples:
+*IDN?, *OPC(?), *RST, *CLS, *ESE, *SRE, *ESR?, *STB?, FREQ:CENT/SPAN/STAR/STOP,
+SWE:POIN/TIME/COUN, BAND(:VID), DISP:WIND:TRAC:Y:RLEV, INP:ATT, DET,
+DISP:WIND:TRAC:MODE, INIT(:CONT), FORM (ASC, REAL,32, REAL,64), TRAC? TRACEn,
+CALC:MARK:MAX/X/Y, TRAC:IQ:SRAT, TRAC:IQ:DATA:MEM?, SYST:ERR(:ALL)?,
+STAT:OPER:COND?/EVEN?/PTR/NTR and a few commands that are only accepted.
+
+Sweeps take real time (sweep time * sweep_time_scale, plus rearm_time between
+the sweeps of a continuous or multiple sweep), every command message can be
+delayed by a latency with random jitter. The spectrum is noise plus the
+carriers in FSWSimulator.carriers [(frequency in Hz, level in dBm)].
+
+VXI-11 and HiSLIP are not implemented, use the raw socket transport
+(FSW.transport = 'socket', or RsInstrument with 'TCPIP::<ip>::<port>::SOCKET').
+
+    python fsw_simulator.py --port 5025 --sweep-time 0.01 --latency 0.0005
+
+    sim = FSWSimulator(port=0)  # free port
+    sim.start()
+    ... connect to 127.0.0.1:sim.port ...
+    sim.stop()
+
+
+"""
+
+
+import re
+import sys
+import time
+import socket
+import argparse
+import threading
+import socketserver
+import numpy as np
+
+from fswcontrol import parse_value
+
+
+VOWELS = 'AEIOU'
+
+# other spellings of the same command
+ALIASES = {
+    'BWID': 'BAND',
+    'BAND:RES': 'BAND',
+    'DISP:WIND:TRAC:Y:SCAL:RLEV': 'DISP:WIND:TRAC:Y:RLEV',
+    'DISP:TRAC:Y:RLEV': 'DISP:WIND:TRAC:Y:RLEV',
+    'DISP:TRAC:MODE': 'DISP:WIND:TRAC:MODE',
+    'DET:FUNC': 'DET',
+    'INIT:IMM': 'INIT',
+    'FORM:DATA': 'FORM',
+    'TRAC:DATA': 'TRAC',
+    'TRAC:IQ:DATA:MEM': 'TRAC:IQ:MEM',
+    'TRAC:DATA:MEM': 'TRAC:MEM',
+}
+
+
+def short_form(header):
+    # 'SENSe:FREQuency:CENTer' and 'FREQ:CENT' -> ('FREQ:CENT', {}),
+    # 'CALCulate2:MARKer1:X' -> ('CALC:MARK:X', {'CALC': 2, 'MARK': 1})
+    nodes = []
+    suffixes = {}
+    for node in header.strip().lstrip(':').split(':'):
+        match = re.fullmatch(r'([A-Za-z]+)(\d*)', node)
+        if match is None:
+            nodes.append(node.upper())
+            continue
+        name, number = match.group(1).upper(), match.group(2)
+        if len(name) > 4:
+            name = name[:3] if name[3] in VOWELS else name[:4]
+        nodes.append(name)
+        if number:
+            suffixes[name] = int(number)
+    if nodes and nodes[0] == 'SENS':
+        nodes = nodes[1:]
+    key = ':'.join(nodes)
+    return ALIASES.get(key, key), suffixes
+
+
+def number(value):
+    return '{:.12G}'.format(value)
+
+
+class FSWSimulator:
+
+    def __init__(self, host='127.0.0.1', port=5025, sweep_time=None, sweep_time_scale=1.0,
+                 latency=0.0, jitter=0.0, seed=None):
+
+        self.host = host
+        self.port = port
+        self.sweep_time = sweep_time  # fixed sweep time in s, None: auto
+        self.sweep_time_scale = sweep_time_scale  # < 1 runs sweeps faster than real time
+        self.latency = latency  # s per command message
+        self.jitter = jitter  # s, uniform random on top of the latency
+        self.carriers = [(61.0e9, -20.0)]
+        self.rearm_time = 0.0  # s between two sweeps (re-arm and processing)
+        self.noise_floor = -90.0
+        self.idn = 'Rohde&Schwarz,FSW-67,1312.8000K67/000000,5.00 (simulator)'
+
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.RLock()
+        self.server = None
+        self.thread = None
+        self.commands = 0  # number of received command messages
+        self.reset()
+
+
+    # state
+
+    def reset(self):
+        with self.lock:
+            self.settings = {
+                'FREQ:CENT': 13.25e9,
+                'FREQ:SPAN': 26.5e9,
+                'SWE:POIN': 1001,
+                'BAND': 3e6,
+                'BAND:VID': 10e6,
+                'DISP:WIND:TRAC:Y:RLEV': 0.0,
+                'INP:ATT': 10.0,
+                'SWE:COUN': 0,
+                'TRAC:IQ:SRAT': 32e6,
+                'SYST:DISP:UPD': 0,
+            }
+            self.auto = {'BAND': True, 'BAND:VID': True, 'SWE:TIME': True}
+            self.manual_sweep_time = 0.001
+            self.form = 'ASC'
+            self.byte_order = 'SWAP'
+            self.continuous = False
+            self.trace_mode = ['WRIT'] + ['BLAN']*5
+            self.detector = ['RMS']*6
+            self.traces = [None]*6
+            self.averages = [0]*6
+            self.markers = {}  # (window, marker) -> index
+            self.errors = []
+            self.esr = 0
+            self.ese = 0
+            self.sre = 0
+            self.opc_pending = False
+            self.sweep_start = None  # time of the running sweep(s)
+            self.sweep_end = None
+            self.sweeps_done = 0  # in the running INIT
+            self.sweeps_total = 0  # number of completed sweeps since reset
+            self.last_sweep = None
+            # STAT:OPER event register, bit 3 is set at the end of a sweep
+            # with the negative transition filter (NTR 8)
+            self.oper_event = 0
+            self.oper_ptr = 32767
+            self.oper_ntr = 0
+
+
+    def freq_axis(self):
+        span = self.settings['FREQ:SPAN']
+        start = self.settings['FREQ:CENT'] - span/2
+        return np.linspace(start, start + span, int(self.settings['SWE:POIN']))
+
+
+    def auto_couple(self):
+        span = self.settings['FREQ:SPAN']
+        if self.auto['BAND']:
+            # 1-3-10 steps, about span/100
+            rbw = 10**np.floor(np.log10(max(span/100, 1)))
+            rbw *= 3 if span/100 >= 3*rbw else 1
+            self.settings['BAND'] = min(max(rbw, 1.0), 10e6)
+        if self.auto['BAND:VID']:
+            self.settings['BAND:VID'] = 3*self.settings['BAND']
+
+
+    def get_sweep_time(self):
+        if self.sweep_time is not None:
+            return self.sweep_time
+        if not self.auto['SWE:TIME']:
+            return self.manual_sweep_time
+        rbw = self.settings['BAND']
+        return max(1e-3, 2.5*self.settings['FREQ:SPAN']/rbw**2)
+
+
+    def spectrum(self, detector):
+        f = self.freq_axis()
+        rbw = self.settings['BAND']
+        power = np.full(f.size, 10**(self.noise_floor/10))
+        sigma = rbw/2.355
+        for f_carrier, level in self.carriers:
+            power += 10**(level/10)*np.exp(-0.5*((f - f_carrier)/sigma)**2)
+        level = 10*np.log10(power)
+        noise = self.rng.normal(0, 1, f.size)
+        if detector.startswith('POS'):
+            level += 3 + np.abs(noise)
+        elif detector.startswith('NEG'):
+            level += -3 - np.abs(noise)
+        elif detector.startswith('SAMP'):
+            level += 2*noise
+        else:
+            level += 0.5*noise
+        return level.astype(np.float32)
+
+
+    def complete_sweep(self):
+        # one sweep, applied to all visible traces with their trace mode
+        for i, mode in enumerate(self.trace_mode):
+            if mode in ('BLAN', 'VIEW'):
+                continue
+            new = self.spectrum(self.detector[i])
+            old = self.traces[i]
+            if old is None or old.size != new.size or mode == 'WRIT':
+                self.traces[i] = new
+                self.averages[i] = 1
+            elif mode == 'MAXH':
+                np.maximum(old, new, out=old)
+            elif mode == 'MINH':
+                np.minimum(old, new, out=old)
+            elif mode == 'AVER':
+                self.averages[i] += 1
+                old += (new - old)/self.averages[i]
+        self.sweeps_total += 1
+        self.last_sweep = time.time()
+        if self.oper_ntr & 8:
+            self.oper_event |= 8
+
+
+    def update(self):
+        # completes the sweeps that are due by now
+        if self.sweep_start is None:
+            return
+        cycle = self.get_sweep_time()*self.sweep_time_scale + self.rearm_time
+        due = int((time.time() - self.sweep_start)/cycle) if cycle > 0 else 1 << 30
+        count = max(int(self.settings['SWE:COUN']), 1)
+        if not self.continuous:
+            due = min(due, count)
+        # at most one new trace per update, missed sweeps are only counted
+        if due > self.sweeps_done:
+            self.sweeps_total += due - self.sweeps_done - 1
+            self.complete_sweep()
+            self.sweeps_done = due
+        if not self.continuous and self.sweeps_done >= count:
+            self.sweep_start = None
+            self.sweep_end = None
+            if self.opc_pending:
+                self.opc_pending = False
+                self.esr |= 1  # operation complete
+
+
+    def sweeping(self):
+        return self.sweep_start is not None
+
+
+    def start_sweep(self):
+        self.sweep_start = time.time()
+        self.sweeps_done = 0
+        count = max(int(self.settings['SWE:COUN']), 1)
+        self.sweep_end = self.sweep_start + count*(self.get_sweep_time()*self.sweep_time_scale + self.rearm_time)
+        for i, mode in enumerate(self.trace_mode):
+            if mode in ('MAXH', 'MINH', 'AVER') and not self.continuous:
+                # a single sweep restarts the hold / average traces
+                self.traces[i] = None
+
+
+    def wait_operations(self):
+        # *OPC? and *WAI: block until the single sweep is done
+        while True:
+            with self.lock:
+                self.update()
+                if not self.sweeping() or self.continuous:
+                    return
+                remaining = self.sweep_end - time.time()
+            time.sleep(min(max(remaining, 0.0005), 0.05))
+
+
+    def status_byte(self):
+        stb = 0
+        if self.errors:
+            stb |= 4  # error queue not empty
+        if self.esr & self.ese:
+            stb |= 32  # event status bit
+        if stb & self.sre:
+            stb |= 64  # service request
+        return stb
+
+
+    def error(self, code, message):
+        self.errors.append((code, message))
+        self.esr |= 32 if code in (-100, -102, -113) else 16
+
+
+    def block(self, values):
+        dtype = {'REAL,32': 'f4', 'REAL,64': 'f8'}.get(self.form)
+        if dtype is None:
+            return ','.join('{:.9E}'.format(value) for value in values).encode()
+        dtype = ('<' if self.byte_order == 'SWAP' else '>') + dtype
+        data = np.asarray(values).astype(dtype).tobytes()
+        length = str(len(data))
+        return '#{}{}'.format(len(length), length).encode() + data
+
+
+    # commands
+
+    def execute(self, cmd):
+        # returns the response (bytes) of a query, None for settings
+        cmd = cmd.strip()
+        if not cmd:
+            return None
+        header, _, args = cmd.partition(' ')
+        query = header.endswith('?')
+        key, suffixes = short_form(header.rstrip('?'))
+        args = args.strip()
+
+        with self.lock:
+            self.update()
+            if key.startswith('*'):
+                return self.common(key, query, args)
+            method = getattr(self, 'cmd_' + key.replace(':', '_').lower(), None)
+            if method is not None:
+                return method(query, args, suffixes)
+            if key in self.settings:
+                return self.setting(key, query, args)
+            if not query and key in ACCEPTED:
+                return None
+            self.error(-113, 'Undefined header;' + cmd)
+        return None
+
+
+    def common(self, key, query, args):
+        if key == '*IDN' and query:
+            return self.idn.encode()
+        if key == '*OPC':
+            if query:
+                self.lock.release()
+                try:
+                    self.wait_operations()
+                finally:
+                    self.lock.acquire()
+                return b'1'
+            if self.sweeping() and not self.continuous:
+                self.opc_pending = True
+            else:
+                self.esr |= 1
+            return None
+        if key == '*WAI':
+            self.lock.release()
+            try:
+                self.wait_operations()
+            finally:
+                self.lock.acquire()
+            return None
+        if key == '*RST':
+            self.reset()
+            return None
+        if key == '*CLS':
+            self.esr = 0
+            self.errors = []
+            return None
+        if key in ('*ESE', '*SRE'):
+            name = key[1:].lower()
+            if query:
+                return str(getattr(self, name)).encode()
+            setattr(self, name, int(float(args)))
+            return None
+        if key == '*ESR' and query:
+            esr, self.esr = self.esr, 0
+            return str(esr).encode()
+        if key == '*STB' and query:
+            return str(self.status_byte()).encode()
+        if key == '*OPT' and query:
+            return b'0'
+        self.error(-113, 'Undefined header;' + key)
+        return None
+
+
+    def setting(self, key, query, args):
+        if query:
+            value = self.settings[key]
+            return (str(int(value)) if isinstance(value, int) else number(value)).encode()
+        value = parse_value(args)
+        if not isinstance(value, float):
+            self.error(-141, 'Invalid character data;' + key + ' ' + args)
+            return None
+        if key == 'SWE:POIN':
+            value = int(min(max(value, 101), 100001))
+        elif key == 'SWE:COUN':
+            value = int(value)
+        self.settings[key] = value
+        if key in self.auto:
+            self.auto[key] = False
+        self.auto_couple()
+        return None
+
+
+    def cmd_freq_star(self, query, args, suffixes):
+        start = self.settings['FREQ:CENT'] - self.settings['FREQ:SPAN']/2
+        if query:
+            return number(start).encode()
+        stop = start + self.settings['FREQ:SPAN']
+        self.set_start_stop(parse_value(args), stop)
+
+    def cmd_freq_stop(self, query, args, suffixes):
+        stop = self.settings['FREQ:CENT'] + self.settings['FREQ:SPAN']/2
+        if query:
+            return number(stop).encode()
+        start = stop - self.settings['FREQ:SPAN']
+        self.set_start_stop(start, parse_value(args))
+
+    def set_start_stop(self, start, stop):
+        self.settings['FREQ:CENT'] = (start + stop)/2
+        self.settings['FREQ:SPAN'] = stop - start
+        self.auto_couple()
+
+
+    def cmd_band_auto(self, query, args, suffixes):
+        return self.auto_setting('BAND', query, args)
+
+    def cmd_band_vid_auto(self, query, args, suffixes):
+        return self.auto_setting('BAND:VID', query, args)
+
+    def cmd_swe_time_auto(self, query, args, suffixes):
+        return self.auto_setting('SWE:TIME', query, args)
+
+    def auto_setting(self, key, query, args):
+        if query:
+            return b'1' if self.auto[key] else b'0'
+        self.auto[key] = parse_value(args) == 1
+        self.auto_couple()
+
+
+    def cmd_swe_time(self, query, args, suffixes):
+        if query:
+            return number(self.get_sweep_time()).encode()
+        self.manual_sweep_time = parse_value(args)
+        self.auto['SWE:TIME'] = False
+
+
+    def cmd_det(self, query, args, suffixes):
+        trace = suffixes.get('DET', 1) - 1
+        if query:
+            return self.detector[trace].encode()
+        self.detector[trace] = short_form(args)[0]  # 'POSitive' -> 'POS'
+
+
+    def cmd_disp_wind_trac_mode(self, query, args, suffixes):
+        trace = suffixes.get('TRAC', 1) - 1
+        if query:
+            return self.trace_mode[trace].encode()
+        self.trace_mode[trace] = short_form(args)[0]  # 'MAXHold' -> 'MAXH'
+        self.traces[trace] = None
+
+
+    def cmd_init(self, query, args, suffixes):
+        if not self.continuous:
+            self.start_sweep()
+
+    def cmd_init_cont(self, query, args, suffixes):
+        if query:
+            return b'1' if self.continuous else b'0'
+        self.continuous = parse_value(args) == 1
+        if self.continuous:
+            self.start_sweep()
+        else:
+            self.sweep_start = None
+
+    def cmd_abor(self, query, args, suffixes):
+        self.sweep_start = None
+        self.opc_pending = False
+
+
+    def cmd_form(self, query, args, suffixes):
+        if query:
+            return (self.form if self.form != 'ASC' else 'ASC,0').encode()
+        form = args.upper().replace(' ', '')
+        if form.startswith('ASC'):
+            self.form = 'ASC'
+        elif form in ('REAL,32', 'REAL,64'):
+            self.form = form
+        else:
+            self.error(-224, 'Illegal parameter value;FORM ' + args)
+
+    def cmd_form_bord(self, query, args, suffixes):
+        if query:
+            return self.byte_order.encode()
+        self.byte_order = 'SWAP' if args.upper().startswith('SWAP') else 'NORM'
+
+
+    def trace_values(self, args):
+        match = re.fullmatch(r'TRACE?(\d)', args.strip().upper())
+        if match is None:
+            self.error(-224, 'Illegal parameter value;' + args)
+            return None
+        trace = int(match.group(1)) - 1
+        if self.traces[trace] is None or self.traces[trace].size != int(self.settings['SWE:POIN']):
+            # no sweep with these settings yet: noise
+            self.traces[trace] = self.spectrum(self.detector[trace])
+        return self.traces[trace]
+
+    def cmd_trac(self, query, args, suffixes):
+        if not query:
+            self.error(-113, 'Undefined header;TRAC')
+            return None
+        values = self.trace_values(args)
+        return None if values is None else self.block(values)
+
+    def cmd_trac_mem(self, query, args, suffixes):
+        # TRAC:DATA:MEM? TRACE1,<offset>,<number of points>
+        parts = args.split(',')
+        values = self.trace_values(parts[0])
+        if values is None:
+            return None
+        if len(parts) == 3:
+            offset, count = int(parts[1]), int(parts[2])
+            values = values[offset:offset + count]
+        return self.block(values)
+
+
+    def cmd_trac_iq_mem(self, query, args, suffixes):
+        srate = self.settings['TRAC:IQ:SRAT']
+        n = int(min(max(srate*self.get_sweep_time(), 1), 1_000_000))
+        t = np.arange(n)/srate
+        iq = 0.1*np.exp(2j*np.pi*1e6*t) + 1e-4*(self.rng.normal(size=n) + 1j*self.rng.normal(size=n))
+        values = np.empty(2*n, dtype=np.float32)
+        values[0::2] = iq.real
+        values[1::2] = iq.imag
+        return self.block(values)
+
+
+    def marker(self, suffixes):
+        return (suffixes.get('CALC', 1), suffixes.get('MARK', 1))
+
+    def cmd_calc_mark_max(self, query, args, suffixes):
+        trace = self.trace_values('TRACE1')
+        self.markers[self.marker(suffixes)] = int(np.argmax(trace))
+
+    def cmd_calc_mark_x(self, query, args, suffixes):
+        f = self.freq_axis()
+        if query:
+            return number(f[self.markers.get(self.marker(suffixes), 0)]).encode()
+        self.markers[self.marker(suffixes)] = int(np.argmin(np.abs(f - parse_value(args))))
+
+    def cmd_calc_mark_y(self, query, args, suffixes):
+        trace = self.trace_values('TRACE1')
+        return number(trace[self.markers.get(self.marker(suffixes), 0)]).encode()
+
+
+    def cmd_syst_err(self, query, args, suffixes):
+        if not self.errors:
+            return b'0,"No error"'
+        code, message = self.errors.pop(0)
+        return '{},"{}"'.format(code, message).encode()
+
+    def cmd_syst_err_all(self, query, args, suffixes):
+        if not self.errors:
+            return b'0,"No error"'
+        errors, self.errors = self.errors, []
+        return ','.join('{},"{}"'.format(code, message) for code, message in errors).encode()
+
+    def cmd_syst_pres(self, query, args, suffixes):
+        self.reset()
+
+    def cmd_stat_oper_cond(self, query, args, suffixes):
+        return b'8' if self.sweeping() else b'0'  # bit 3: sweeping
+
+    def cmd_stat_oper_even(self, query, args, suffixes):
+        event, self.oper_event = self.oper_event, 0
+        return str(event).encode()
+
+    def cmd_stat_oper_ptr(self, query, args, suffixes):
+        if query:
+            return str(self.oper_ptr).encode()
+        self.oper_ptr = int(float(args))
+
+    def cmd_stat_oper_ntr(self, query, args, suffixes):
+        if query:
+            return str(self.oper_ntr).encode()
+        self.oper_ntr = int(float(args))
+
+    def cmd_lay_add_wind(self, query, args, suffixes):
+        return b"'2'"
+
+
+    # server
+
+    def handle_message(self, line):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.rng.uniform(0, self.jitter))
+        self.commands += 1
+        responses = []
+        path = ''
+        for part in split_message(line):
+            part = part.strip()
+            if not part:
+                continue
+            if not part.startswith((':', '*')) and path:
+                # SCPI: a command without leading colon continues the path
+                # of the previous command in the message
+                part = path + ':' + part
+            if not part.startswith('*'):
+                header = part.lstrip(':').split(' ')[0]
+                path = ':'.join(header.split(':')[:-1])
+            response = self.execute(part.lstrip(':'))
+            if response is not None:
+                responses.append(response)
+        if responses:
+            return b';'.join(responses) + b'\n'
+        return None
+
+
+    def start(self):
+        simulator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                for line in self.rfile:
+                    response = simulator.handle_message(line.decode(errors='replace'))
+                    if response is not None:
+                        self.wfile.write(response)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fsw-simulator', daemon=True)
+        self.thread.start()
+        print('FSW simulator listening on {}:{}'.format(self.host, self.port))
+        return self
+
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def split_message(line):
+    # split at ';' outside of quotes
+    parts = []
+    current = ''
+    quote = None
+    for char in line.strip():
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char == ';':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    parts.append(current)
+    return parts
+
+
+# settings without effect in the simulator, accepted silently
+ACCEPTED = {
+    'INST:CRE:NEW', 'INST:SEL', 'TRAC:IQ:DATA:FORM', 'TRAC:IQ:FORM', 'TRAC:IQ',
+    'MMEM:LOAD:STAT', 'MMEM:STOR:STAT', 'MMEM:NAME', 'HCOP:DEV:LANG', 'HCOP:IMM',
+    'DISP:WIND:TRAC:Y:SPAC', 'CALC:MARK', 'CALC:MARK:STAT',
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='FSW SCPI simulator (raw socket)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5025)
+    parser.add_argument('--sweep-time', type=float, default=None, help='fixed sweep time in s')
+    parser.add_argument('--sweep-time-scale', type=float, default=1.0)
+    parser.add_argument('--latency', type=float, default=0.0, help='s per command message')
+    parser.add_argument('--jitter', type=float, default=0.0, help='s, random on top of the latency')
+    args = parser.parse_args()
+
+    sim = FSWSimulator(args.host, args.port, args.sweep_time, args.sweep_time_scale, args.latency, args.jitter)
+    sim.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
+        sys.exit(0)
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_socket.py"
+
+Raw TCP (port 5025) SCPI transport for the FSW, without VISA.
+
+SocketInstrument has the methods of RsInstrument that the FSW class uses, so
+it can be used in its place (FSW.transport = 'socket'). Responses are received
+with recv_into into one reusable buffer. Binary blocks (IEEE 488.2 definite
+length '#<digits><length><data>') can be read directly into a NumPy array with
+query_bin_block_into(), without intermediate byte strings.
+
+
+"""
+
+
+import re
+import socket
+import numpy as np
+from RsInstrument import BinFloatFormat
+
+
+# numpy data types of the driver's binary float formats
+BIN_FLOAT_DTYPES = {
+    BinFloatFormat.Single_4bytes: '<f4',
+    BinFloatFormat.Single_4bytes_swapped: '>f4',
+    BinFloatFormat.Double_8bytes: '<f8',
+    BinFloatFormat.Double_8bytes_swapped: '>f8',
+}
+
+
+class InstrumentError(Exception):
+    pass
+
+
+def parse_errors(answer):
+    # answer of SYST:ERR:ALL?, '-113,"Undefined header;FOO",-222,"Data out of
+    # range"' -> [(code, message)], without '0,"No error"'
+    errors = [(int(code), message) for code, message in re.findall(r'(-?\d+),"([^"]*)"', answer)]
+    return [error for error in errors if error[0] != 0]
+
+
+class SocketInstrument:
+
+    def __init__(self, ip, port=5025, timeout=20000, nodelay=True, rcvbuf=None, sndbuf=None):
+
+        self.ip = ip
+        self.port = port
+        self.sock = socket.create_connection((ip, port), timeout=timeout/1000)
+        if nodelay:
+            # small commands are sent at once and not delayed by Nagle
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if rcvbuf:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        if sndbuf:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+
+        self._visa_timeout = timeout
+        self.opc_timeout = timeout
+        self.instrument_status_checking = False
+        self.bin_float_numbers_format = BinFloatFormat.Single_4bytes
+
+        # received but not yet read data is rx[start:end]
+        self.rx = bytearray(65536)
+        self.start = 0
+        self.end = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+    @property
+    def visa_timeout(self):
+        return self._visa_timeout
+
+    @visa_timeout.setter
+    def visa_timeout(self, value):
+        self._visa_timeout = value
+        self.sock.settimeout(value/1000)
+
+
+    # low level
+
+    def send(self, cmd):
+        data = cmd.encode() + b'\n'
+        self.sock.sendall(data)
+        self.bytes_sent += len(data)
+
+
+    def receive(self):
+        # append received data to rx, returns the number of new bytes
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.rx):
+            if self.start > 0:
+                # move the pending data to the front
+                pending = self.end - self.start
+                self.rx[:pending] = self.rx[self.start:self.end]
+                self.start, self.end = 0, pending
+            else:
+                self.rx.extend(bytes(len(self.rx)))
+        n = self.sock.recv_into(memoryview(self.rx)[self.end:])
+        if n == 0:
+            raise ConnectionError('connection closed by the instrument')
+        self.end += n
+        self.bytes_received += n
+        return n
+
+
+    def read_line(self):
+        while True:
+            position = self.rx.find(b'\n', self.start, self.end)
+            if position >= 0:
+                line = bytes(self.rx[self.start:position])
+                self.start = position + 1
+                return line.decode().strip()
+            self.receive()
+
+
+    def read_exact(self, n):
+        while self.end - self.start < n:
+            self.receive()
+        data = bytes(self.rx[self.start:self.start + n])
+        self.start += n
+        return data
+
+
+    def read_into(self, view):
+        # fills the memoryview, pending data first, the rest is received
+        # straight into the view
+        pending = min(self.end - self.start, len(view))
+        view[:pending] = self.rx[self.start:self.start + pending]
+        self.start += pending
+        position = pending
+        while position < len(view):
+            n = self.sock.recv_into(view[position:])
+            if n == 0:
+                raise ConnectionError('connection closed by the instrument')
+            position += n
+            self.bytes_received += n
+
+
+    def read_block_header(self):
+        # returns the length of the block, None for an ASCII response (the
+        # response is not consumed then)
+        while self.end - self.start < 2:
+            self.receive()
+        if self.rx[self.start] != ord('#'):
+            return None
+        digits = int(chr(self.rx[self.start + 1]))
+        if digits == 0:
+            raise InstrumentError('indefinite length blocks are not supported')
+        self.start += 2
+        return int(self.read_exact(digits))
+
+
+    def skip(self, n):
+        while n > 0:
+            if self.start == self.end:
+                self.receive()
+            chunk = min(n, self.end - self.start)
+            self.start += chunk
+            n -= chunk
+
+
+    def with_timeout(self, timeout, function, *args):
+        self.sock.settimeout(timeout/1000)
+        try:
+            return function(*args)
+        finally:
+            self.sock.settimeout(self._visa_timeout/1000)
+
+
+    # RsInstrument compatible methods
+
+    def write_str(self, cmd):
+        self.send(cmd)
+        if self.instrument_status_checking:
+            self.check_status()
+
+    def write(self, cmd):
+        self.write_str(cmd)
+
+    def write_str_with_opc(self, cmd, timeout=None):
+        self.send(cmd + ';*OPC?')
+        self.with_timeout(timeout or self.opc_timeout, self.read_line)
+        if self.instrument_status_checking:
+            self.check_status()
+
+    def write_with_opc(self, cmd, timeout=None):
+        self.write_str_with_opc(cmd, timeout)
+
+    def query_str(self, query):
+        self.send(query)
+        answer = self.read_line()
+        if self.instrument_status_checking:
+            self.check_status()
+        return answer
+
+    def query(self, query):
+        return self.query_str(query)
+
+    def query_float(self, query):
+        return float(self.query_str(query))
+
+    def query_int(self, query):
+        return int(float(self.query_str(query)))
+
+    def query_opc(self, timeout=0):
+        self.send('*OPC?')
+        return int(self.with_timeout(timeout or self.opc_timeout, self.read_line))
+
+    def query_bin_block(self, query):
+        self.send(query)
+        length = self.read_block_header()
+        if length is None:
+            raise InstrumentError('expected a binary block, got {!r}'.format(self.read_line()))
+        data = self.read_exact(length)
+        self.read_line()  # terminating line feed
+        if self.instrument_status_checking:
+            self.check_status()
+        return data
+
+    def query_bin_block_into(self, query, out):
+        # Reads the binary block of the query directly into 'out' (writable
+        # buffer, e.g. a NumPy array), returns the number of bytes.
+        view = memoryview(out).cast('B')
+        self.send(query)
+        length = self.read_block_header()
+        if length is None:
+            raise InstrumentError('expected a binary block, got {!r}'.format(self.read_line()))
+        if length > len(view):
+            self.skip(length)
+            self.read_line()
+            raise ValueError('block of {} bytes does not fit into {} bytes'.format(length, len(view)))
+        self.read_into(view[:length])
+        self.read_line()  # terminating line feed
+        if self.instrument_status_checking:
+            self.check_status()
+        return length
+
+    def query_bin_blocks_into(self, query, out):
+        # Chained query with one binary block per row of 'out' (2D array),
+        # e.g. 'TRAC? TRACE1;:TRAC? TRACE2'. The blocks are separated by ';'
+        # and read in one pass straight into the rows, returns the number of
+        # bytes of every block.
+        self.send(query)
+        lengths = []
+        for i, row in enumerate(out):
+            view = memoryview(row).cast('B')
+            length = self.read_block_header()
+            if length is None:
+                raise InstrumentError('expected a binary block, got {!r}'.format(self.read_line()))
+            if length > len(view):
+                self.skip(length)
+                self.read_line()
+                raise ValueError('block of {} bytes does not fit into {} bytes'.format(length, len(view)))
+            self.read_into(view[:length])
+            lengths.append(length)
+            if i < len(out) - 1:
+                self.read_exact(1)  # ';'
+        self.read_line()  # terminating line feed
+        if self.instrument_status_checking:
+            self.check_status()
+        return lengths
+
+    def query_bin_or_ascii_float_list(self, query):
+        self.send(query)
+        length = self.read_block_header()
+        if length is None:
+            values = [float(value) for value in self.read_line().split(',')]
+        else:
+            dtype = BIN_FLOAT_DTYPES[self.bin_float_numbers_format]
+            values = np.frombuffer(self.read_exact(length), dtype=dtype).tolist()
+            self.read_line()
+        if self.instrument_status_checking:
+            self.check_status()
+        return values
+
+    def query_all_errors(self):
+        answer = self.query_str_unchecked('SYST:ERR:ALL?')
+        errors = ['{},"{}"'.format(code, message) for code, message in parse_errors(answer)]
+        return errors or None
+
+    def query_str_unchecked(self, query):
+        self.send(query)
+        return self.read_line()
+
+    def check_status(self):
+        errors = self.query_all_errors()
+        if errors:
+            raise InstrumentError('instrument reported errors: ' + ', '.join(errors))
+
+    def clear_status(self):
+        self.send('*CLS')
+
+    def reset(self, timeout=0):
+        self.write_str_with_opc('*RST', timeout or None)
+
+    def close(self):
+        self.sock.close()
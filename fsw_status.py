@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_status.py"
+
+Deferred error checking and sweep completion for the FSW class.
+
+With instrument_status_checking the driver asks for the error queue after
+every command, which doubles the round trips. DeferredErrorCheck wraps
+FSW.instr, logs the commands instead and reads the whole error queue
+(SYST:ERR:ALL?) only when check() is called (FSW: after every configure() and
+measure()) or after every N commands. Errors are mapped back to the command
+that caused them if the instrument names it ('-113,"Undefined header;FOO"'),
+otherwise to the commands since the last check.
+
+SweepWaiter waits for the end of a sweep started with 'INIT;*OPC' on the
+status byte instead of blocking the session in *OPC? (see FSW.sweep_async).
+
+
+"""
+
+
+import time
+import collections
+
+from fsw_socket import InstrumentError, parse_errors
+
+
+ESB = 32  # event status bit of the status byte
+RQS = 64  # service request bit of the status byte
+ESR_ERRORS = 4 | 8 | 16 | 32  # query, device, execution and command error
+
+
+def header_of(command):
+    return command.strip().lstrip(':').split(' ')[0].upper()
+
+
+class DeferredErrorCheck:
+    # Proxy for FSW.instr, commands are logged and the error queue is read
+    # with check(). All other attributes are passed through.
+
+    def __init__(self, instr, every=None, log_size=1000):
+        object.__setattr__(self, 'instr', instr)
+        object.__setattr__(self, 'every', every)  # check every n commands, None: only check()
+        object.__setattr__(self, 'pending', collections.deque(maxlen=log_size))
+        object.__setattr__(self, 'count', 0)  # commands since the start
+        object.__setattr__(self, 'checks', 0)
+
+
+    def __getattr__(self, name):
+        attribute = getattr(self.instr, name)
+        if not callable(attribute) or not name.startswith(('write', 'query')):
+            return attribute
+
+        def wrapper(*args, **kwargs):
+            command = str(args[0]) if args and isinstance(args[0], str) else name
+            result = attribute(*args, **kwargs)
+            object.__setattr__(self, 'count', self.count + 1)
+            self.pending.append((self.count, command))
+            if self.every and len(self.pending) >= self.every:
+                self.check()
+            return result
+
+        return wrapper
+
+
+    def __setattr__(self, name, value):
+        setattr(self.instr, name, value)
+
+
+    def attach(self, instr, every=None):
+        # new inner instrument (e.g. with profiling), the log is kept
+        object.__setattr__(self, 'instr', instr)
+        object.__setattr__(self, 'every', every)
+
+
+    def check(self):
+        # reads the error queue once, raises InstrumentError if there are
+        # errors since the last check
+        answer = self.instr.query_str('SYST:ERR:ALL?')
+        object.__setattr__(self, 'checks', self.checks + 1)
+        commands = list(self.pending)
+        self.pending.clear()
+        errors = parse_errors(answer)
+        if not errors:
+            return
+
+        lines = []
+        mapped = []
+        for code, message in errors:
+            cause = self.find_cause(message, commands)
+            if cause is not None:
+                number, command = cause
+                lines.append("{} '{}' caused by '{}' (command {})".format(code, message, command, number))
+                mapped.append((code, message, [cause]))
+            else:
+                window = ', '.join("'{}'".format(command) for number, command in commands[-10:])
+                if len(commands) > 10:
+                    window = '... ' + window
+                lines.append("{} '{}' in one of the last {} commands: {}".format(code, message, len(commands), window))
+                mapped.append((code, message, commands))
+
+        error = InstrumentError('instrument reported errors:\n' + '\n'.join(lines))
+        error.errors = mapped
+        raise error
+
+
+    def find_cause(self, message, commands):
+        # the FSW appends the failing command after ';' to many error messages
+        if ';' not in message:
+            return None
+        context = header_of(message.split(';', 1)[1])
+        if not context:
+            return None
+        for number, command in reversed(commands):
+            for part in command.split(';'):
+                if header_of(part) == context or header_of(part).startswith(context):
+                    return number, command
+        return None
+
+
+class SweepWaiter:
+    # Waits for the end of a sweep started with 'INIT;*OPC' by reading the
+    # status byte. With *ESE 1 the operation complete bit sets the event
+    # status bit (ESB) and with *SRE 32 the service request (RQS). The first
+    # *STB? is sent shortly before the expected end of the sweep (SWE:TIME?),
+    # then the interval grows from min_interval up to max_interval. The
+    # instrument should be used without status checking (every *STB? would
+    # be followed by an error query).
+
+    def __init__(self, instr, expected, timeout=20.0, min_interval=0.001, max_interval=0.05):
+        self.instr = instr
+        self.expected = expected  # expected duration of the sweep in s
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.polls = 0
+
+
+    def poll(self):
+        # True if the operation is complete
+        self.polls += 1
+        return bool(int(self.instr.query_str('*STB?')) & (ESB | RQS))
+
+
+    def wait(self):
+        # returns the event status register (read and cleared with *ESR?)
+        start = time.perf_counter()
+        time.sleep(0.9*self.expected)
+        interval = min(max(self.expected/100, self.min_interval), self.max_interval)
+        while not self.poll():
+            if time.perf_counter() - start > self.timeout:
+                raise TimeoutError('sweep not complete after {:.1f} s ({} polls)'.format(self.timeout, self.polls))
+            time.sleep(interval)
+            interval = min(interval*1.5, self.max_interval)
+        return int(self.instr.query_str('*ESR?'))
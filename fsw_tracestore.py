@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_tracestore.py"
+
+Memory-mapped trace store of a scan (FSW.open_store, measure() appends a row
+per trace):
+
+    FSW_traces.f32        float32 (little endian) [position, point], raw
+    FSW_traces_index.csv  one line per row: row;name;az;el;time;f_start;
+                          f_stop;marker_x;marker_y
+    FSW_traces.json       number of points, frequency axis and settings of
+                          the first measurement
+
+TraceStore opens the data with np.memmap only when it is used, a position
+(store.position(az, el)) or a frequency bin over all positions
+(store.frequency_bin(f)) is a view of the mapped file, nothing is parsed or
+copied.
+
+
+"""
+
+
+import os
+import json
+import numpy as np
+
+from fsw_dataset import position_of, ROW_LABELS
+
+
+STORE_DATA = 'FSW_traces.f32'
+STORE_INDEX = 'FSW_traces_index.csv'
+STORE_META = 'FSW_traces.json'
+
+INDEX_COLUMNS = ['row', 'name', 'az', 'el', 'time', 'f_start', 'f_stop', 'marker_x', 'marker_y']
+
+
+class TraceStoreWriter:
+
+    def __init__(self, path):
+        # appends to an existing store in the folder
+        self.path = path
+        self.meta = None
+        self.rows = 0
+        meta_path = os.path.join(path, STORE_META)
+        if os.path.isfile(meta_path):
+            with open(meta_path) as file:
+                self.meta = json.load(file)
+            self.rows = self.repair()
+        self.data = open(os.path.join(path, STORE_DATA), 'ab')
+        self.index = open(os.path.join(path, STORE_INDEX), 'a')
+        if self.index.tell() == 0:
+            self.index.write(';'.join(INDEX_COLUMNS) + '\n')
+
+
+    def __len__(self):
+        return self.rows
+
+
+    def repair(self):
+        # After a crash the data file or the index can end in the middle of
+        # a row, both are cut to the complete rows. Returns their number.
+        data_path = os.path.join(self.path, STORE_DATA)
+        index_path = os.path.join(self.path, STORE_INDEX)
+        row_bytes = 4*self.meta['n_points']
+        rows = os.path.getsize(data_path)//row_bytes if os.path.isfile(data_path) else 0
+        lines = []
+        if os.path.isfile(index_path):
+            with open(index_path) as file:
+                lines = file.readlines()
+        complete = [line for line in lines if line.endswith('\n')]
+        rows = min(rows, max(len(complete) - 1, 0))
+        if os.path.isfile(data_path) and os.path.getsize(data_path) != rows*row_bytes:
+            with open(data_path, 'r+b') as file:
+                file.truncate(rows*row_bytes)
+        if complete and len(lines) != rows + 1:
+            with open(index_path, 'w') as file:
+                file.writelines(complete[:rows + 1])
+        return rows
+
+
+    def append(self, name, trace, freq, timestamp, marker_x, marker_y, header=()):
+        if self.meta is None:
+            self.meta = {
+                'n_points': len(trace),
+                'frequency': [float(freq[0]), float(freq[-1])],
+                'header': {label: value for label, value in header if label not in ROW_LABELS
+                           and (isinstance(value, (int, float, str)) or value is None)},
+            }
+            with open(os.path.join(self.path, STORE_META), 'w') as file:
+                json.dump(self.meta, file, indent=1)
+        if len(trace) != self.meta['n_points']:
+            raise ValueError('trace has {} points, the store {}'.format(len(trace), self.meta['n_points']))
+
+        az, el = position_of(name)
+        self.data.write(np.asarray(trace, dtype='<f4').tobytes())
+        self.index.write('{};{};{};{};{};{};{};{};{}\n'.format(
+            self.rows, name, az, el, timestamp, freq[0], freq[-1], marker_x, marker_y))
+        # readers see complete rows only
+        self.data.flush()
+        self.index.flush()
+        self.rows += 1
+
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class TraceStore:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, STORE_META)) as file:
+            self.meta = json.load(file)
+        self.n_points = self.meta['n_points']
+        self._traces = None
+        self._index = None
+
+
+    @property
+    def index(self):
+        # {'row', 'name', 'az', ...} arrays, only complete rows
+        if self._index is None:
+            with open(os.path.join(self.path, STORE_INDEX)) as file:
+                lines = [line.rstrip('\n').split(';') for line in file][1:]
+            rows = min(len(lines), os.path.getsize(os.path.join(self.path, STORE_DATA))//(4*self.n_points))
+            lines = lines[:rows]
+            columns = list(zip(*lines)) if lines else [[] for _ in INDEX_COLUMNS]
+            self._index = {}
+            for column, values in zip(INDEX_COLUMNS, columns):
+                if column == 'name':
+                    self._index[column] = np.array(values, dtype=str)
+                elif column == 'row':
+                    self._index[column] = np.array(values, dtype=int)
+                else:
+                    self._index[column] = np.array(values, dtype=float)
+            self._index['position'] = {(az, el): row for row, az, el in
+                                       zip(self._index['row'], self._index['az'], self._index['el'])}
+        return self._index
+
+
+    @property
+    def traces(self):
+        # memory-mapped [position, point], read only
+        if self._traces is None:
+            rows = len(self.index['row'])
+            self._traces = np.memmap(os.path.join(self.path, STORE_DATA), dtype='<f4', mode='r',
+                                     shape=(rows, self.n_points))
+        return self._traces
+
+
+    def __len__(self):
+        return len(self.index['row'])
+
+
+    def frequency(self):
+        f_start, f_stop = self.meta['frequency']
+        return np.linspace(f_start, f_stop, self.n_points)
+
+
+    def position(self, az, el):
+        # trace of a position (view)
+        return self.traces[self.index['position'][(float(az), float(el))]]
+
+
+    def frequency_bin(self, f):
+        # level at the frequency f for all positions (view)
+        return self.traces[:, int(np.argmin(np.abs(self.frequency() - f)))]
+
+
+def open_store(path):
+    # TraceStore of the scan folder, None if there is none
+    if not os.path.isfile(os.path.join(path, STORE_META)):
+        return None
+    return TraceStore(path)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "fsw_writer.py"
+
+Writing of the FSW measurement files.
+
+The files are plain text: a '#' header with the settings and markers and one
+value of the trace per line (readable with np.loadtxt(file, comments='#')).
+
+Scans that only need the maximum of every position (measure(mode='peak'))
+append one line per measurement to the peak table of the scan folder instead.
+
+MeasurementWriter writes the files on a background thread, so the next sweep
+can already run on the instrument while the last one is written to disk. The
+queue is bounded, if the disk is slower than the instrument 'put' blocks until
+there is space again (backpressure). All measurements waiting in the queue
+are written in one batch, durability sets when the files are fsync'ed:
+
+    None      the operating system writes them (fastest)
+    'trace'   every file before the next one is written
+    n (int)   every n files, flush() and close() sync the rest
+
+Up to queue_size + n measurements can be lost with a crash, a scan journal
+(FSW.scan) should check at least as many traces.
+
+
+"""
+
+
+import os
+import queue
+import weakref
+import threading
+import numpy as np
+
+
+PEAK_TABLE = 'FSW_peaks.csv'
+
+
+def format_measurement(trace, header):
+    # Whole file as one string. The values are written like '{}'.format()
+    # of the single values (shortest repr of the float), tolist() and repr
+    # give the same text without formatting every numpy scalar.
+    lines = ['# FSW Measurement']
+    for label, value in header:
+        lines.append('# {}: {}'.format(label, value))
+    lines.append('# Values of trace')
+    lines.extend(map(repr, np.asarray(trace).tolist()))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def write_measurement(f_path, trace, header):
+    # header: list of (label, value), written in this order
+    with open(f_path, 'w') as file:
+        file.write(format_measurement(trace, header))
+
+
+def sync_files(f_paths):
+    # fsync of files that are already written and closed, and of their
+    # folders (new directory entries)
+    for f_path in f_paths:
+        fd = os.open(f_path, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    if hasattr(os, 'O_DIRECTORY'):  # not on Windows
+        for path in set(os.path.dirname(os.path.abspath(f_path)) for f_path in f_paths):
+            fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+def append_peak(path, name, date_time, marker_x, marker_y):
+    f_path = path + os.sep + PEAK_TABLE
+    new = not os.path.isfile(f_path)
+    with open(f_path, 'a') as file:
+        if new:
+            file.write('# FSW Peak Table\n')
+            file.write('# name;date;max marker x;max marker y\n')
+        file.write('{};{};{};{}\n'.format(name, date_time, marker_x, marker_y))
+
+
+def read_peaks(path):
+    # list of (name, date, marker_x, marker_y), None if there is no table
+    f_path = path + os.sep + PEAK_TABLE
+    if not os.path.isfile(f_path):
+        return None
+    peaks = []
+    with open(f_path) as file:
+        for line in file:
+            if line.startswith('#') or not line.strip():
+                continue
+            name, date_time, marker_x, marker_y = line.rstrip('\n').split(';')
+            peaks.append((name, date_time, float(marker_x), float(marker_y)))
+    return peaks
+
+
+class MeasurementWriter:
+
+    def __init__(self, queue_size=4, process=None, durability=None):
+
+        # process(trace, header) is called on the writer thread before the
+        # file is written and may return a new header (post-processing)
+        if not (durability in (None, 'trace') or (isinstance(durability, int) and durability > 0)):
+            raise ValueError("Unknown durability '{}', use None, 'trace' or n traces".format(durability))
+        self.process = process
+        self.durability = durability
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.buffers = queue.Queue()  # trace buffers that can be reused
+        self.issued = weakref.WeakValueDictionary()  # id -> buffer handed out by buffer()
+        self.unsynced = []  # files written but not fsync'ed yet
+        self.error = None
+        self.count = 0
+        self.batches = 0
+
+        self.thread = threading.Thread(target=self.run, name='fsw-writer', daemon=True)
+        self.thread.start()
+
+
+    def buffer(self, n_points):
+        # Returns a float32 buffer for the next trace. Buffers come back from
+        # the writer thread after the file is written, so at most
+        # queue_size + 2 buffers exist at the same time.
+        try:
+            buffer = self.buffers.get_nowait()
+        except queue.Empty:
+            buffer = None
+        if buffer is None or buffer.size != n_points:
+            buffer = np.empty(n_points, dtype=np.float32)
+        self.issued[id(buffer)] = buffer
+        return buffer
+
+
+    def put(self, f_path, trace, header):
+        self.check()
+        self.queue.put((f_path, trace, header))  # blocks if the queue is full
+
+
+    def run(self):
+        while True:
+            # all jobs that are waiting, at least one
+            jobs = [self.queue.get()]
+            while jobs[-1] is not None and jobs[-1] != 'sync':
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for job in jobs:
+                if job is None or job == 'sync':
+                    continue
+                f_path, trace, header = job
+                try:
+                    if self.error is None:
+                        if self.process is not None:
+                            header = self.process(trace, header) or header
+                        write_measurement(f_path, trace, header)
+                        self.unsynced.append(f_path)
+                        self.count += 1
+                        if self.durability == 'trace':
+                            self.sync()
+                except Exception as ex:
+                    # reported to the caller with the next put() or close()
+                    self.error = ex
+                finally:
+                    self.recycle(trace)
+            self.batches += 1
+
+            last = jobs[-1]
+            if last is None or last == 'sync' or (isinstance(self.durability, int)
+                                                  and len(self.unsynced) >= self.durability):
+                self.sync()
+
+            for _ in jobs:
+                self.queue.task_done()
+            if last is None:
+                return
+
+
+    def recycle(self, trace):
+        # Only buffers of buffer() go back to the pool (a part of a buffer,
+        # region of interest, returns the whole buffer). Other arrays, e.g.
+        # the stitched spectrum of measure_segments, are left to the
+        # garbage collector.
+        owner = trace if trace.base is None else trace.base
+        if self.issued.get(id(owner)) is owner:
+            del self.issued[id(owner)]
+            self.buffers.put(owner)
+
+
+    def sync(self):
+        # fsync of the files written since the last sync
+        unsynced, self.unsynced = self.unsynced, []
+        if self.durability is None or self.error is not None or not unsynced:
+            return
+        try:
+            sync_files(unsynced)
+        except Exception as ex:
+            self.error = ex
+
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError('writing measurement failed: {}'.format(error)) from error
+
+
+    def flush(self):
+        # wait until all queued measurements are written (and synced)
+        self.queue.put('sync')
+        self.queue.join()
+        self.check()
+
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.check()
@@ -15,90 +15,550 @@ Class to control the Rohde & Schwarz FSW spectrum analyzer via python commands.
 
 
 import os
+import time
 import datetime
+import threading
+import contextlib
+import collections
+import dataclasses
+import concurrent.futures
+import numpy as np
 from RsInstrument import RsInstrument, BinFloatFormat
 
+from fsw_socket import SocketInstrument
+from fsw_socket import InstrumentError, parse_errors
+from fsw_status import DeferredErrorCheck, SweepWaiter, ESR_ERRORS
+from fsw_profiling import ScpiProfiler, InstrumentedInstrument
+from fsw_writer import MeasurementWriter, write_measurement, append_peak
+from fsw_dataset import ScanDataset, DATASET, position_of
+from fsw_tracestore import TraceStoreWriter, STORE_DATA
+from fsw_catalog import MeasurementCatalog, CATALOG
+from fsw_journal import ScanJournal, JOURNAL
+
+
+# trace transfer formats: SCPI 'FORM' argument and the binary format the
+# driver has to expect (None for ASCII)
+TRACE_FORMATS = {
+    'ASCII': ('ASC', None),
+    'REAL,32': ('REAL,32', BinFloatFormat.Single_4bytes),
+    'REAL,64': ('REAL,64', BinFloatFormat.Double_8bytes),
+}
+
+
+# multipliers for the units used in settings like 'FREQ:CENT 61.0 GHz'
+UNITS = {
+    'HZ': 1, 'KHZ': 1e3, 'MHZ': 1e6, 'GHZ': 1e9,
+    'S': 1, 'MS': 1e-3, 'US': 1e-6, 'NS': 1e-9,
+    'DB': 1, 'DBM': 1,
+}
+
+
+def parse_value(value):
+    # SCPI value as float (units converted), or upper case string if it is
+    # not a number (e.g. 'RMS', 'ON')
+    text = str(value).strip().upper()
+    text = {'ON': '1', 'OFF': '0'}.get(text, text)
+    number = text.rstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ ')
+    unit = text[len(number):].strip()
+    try:
+        return float(number)*UNITS.get(unit, 1)
+    except ValueError:
+        return text
+
+
+def values_match(setting, answer, rel_tol=1e-9):
+    setting = parse_value(setting)
+    answer = parse_value(answer)
+    if isinstance(setting, float) and isinstance(answer, float):
+        return abs(setting - answer) <= rel_tol*max(abs(setting), abs(answer), 1)
+    # the instrument answers with the short form ('POSitive' -> 'POS')
+    return str(setting).startswith(str(answer)) or str(answer).startswith(str(setting))
+
+
+class CommandBatch:
+    # Collects settings (header, value) and joins them into as few
+    # semicolon-chained SCPI messages as possible, e.g.
+    # 'FREQ:CENT 61.0 GHz;:FREQ:SPAN 1000 MHz;:SWE:POIN 1001'
+
+    def __init__(self, max_length=1024):
+        self.max_length = max_length
+        self.settings = []
+
+    def add(self, header, value):
+        self.settings.append((header, value))
+        return self
+
+    def chain(self, parts):
+        messages = []
+        message = ''
+        for part in parts:
+            if message and len(message) + 2 + len(part) > self.max_length:
+                messages.append(message)
+                message = ''
+            message = part if not message else message + ';:' + part
+        if message:
+            messages.append(message)
+        return messages
+
+    def messages(self):
+        return self.chain('{} {}'.format(header, value) for header, value in self.settings)
+
+    def queries(self):
+        # the answers of a chained query are separated by ';'
+        return self.chain('{}?'.format(header) for header, value in self.settings)
+
+
+# settings that change (with auto coupling) when the key is changed
+COUPLED_SETTINGS = {
+    'FREQ:CENT': ['FREQ:STAR', 'FREQ:STOP'],
+    'FREQ:SPAN': ['FREQ:STAR', 'FREQ:STOP', 'BAND', 'BAND:VID', 'SWE:TIME'],
+    'FREQ:STAR': ['FREQ:CENT', 'FREQ:SPAN', 'FREQ:STOP', 'BAND', 'BAND:VID', 'SWE:TIME'],
+    'FREQ:STOP': ['FREQ:CENT', 'FREQ:SPAN', 'FREQ:STAR', 'BAND', 'BAND:VID', 'SWE:TIME'],
+    'BAND': ['BAND:AUTO', 'BAND:VID', 'SWE:TIME'],
+    'BAND:VID': ['BAND:VID:AUTO', 'SWE:TIME'],
+    'SWE:TIME': ['SWE:TIME:AUTO'],
+    'SWE:POIN': ['SWE:TIME'],
+    'BAND:AUTO': ['BAND', 'BAND:VID', 'SWE:TIME'],
+    'BAND:VID:AUTO': ['BAND:VID', 'SWE:TIME'],
+    'SWE:TIME:AUTO': ['SWE:TIME'],
+    # with INP:ATT:AUTO ON the attenuation follows the reference level
+    'DISP:WIND:TRAC:Y:RLEV': ['INP:ATT'],
+    'INP:ATT': ['INP:ATT:AUTO'],
+    'INP:ATT:AUTO': ['INP:ATT'],
+}
+
+
+@dataclasses.dataclass
+class Parameters:
+    # measurement state of the instrument, see PARAMETERS
+    f_center: float = None
+    f_span: float = None
+    f_start: float = None
+    f_stop: float = None
+    N_points: int = None
+    rbw: float = None
+    vbw: float = None
+    ref_level: float = None
+    attenuation: float = None
+    sweep_time: float = None
+    sweep_count: int = None
+    detector: str = None
+    trace_mode: str = None
+
+
+# field of Parameters, SCPI header and label in the measurement file
+PARAMETERS = [
+    ('f_center', 'FREQ:CENT', 'Frequency Center'),
+    ('f_span', 'FREQ:SPAN', 'Frequency Span'),
+    ('f_start', 'FREQ:STAR', 'Frequency Start'),
+    ('f_stop', 'FREQ:STOP', 'Frequency Stop'),
+    ('N_points', 'SWE:POIN', 'Number Points'),
+    ('rbw', 'BAND', 'RBW'),
+    ('vbw', 'BAND:VID', 'VBW'),
+    ('ref_level', 'DISP:WIND:TRAC:Y:RLEV', 'Reference Level'),
+    ('attenuation', 'INP:ATT', 'Attenuation'),
+    ('sweep_time', 'SWE:TIME', 'Sweep Time'),
+    ('sweep_count', 'SWE:COUN', 'Sweep Count'),
+    ('detector', 'DET', 'Detector'),
+    ('trace_mode', 'DISP:WIND:TRAC:MODE', 'Trace Mode'),
+]
+
+
+# item of FSW.stream_traces(), max_hold, min_hold and average are updated in
+# place with every trace
+StreamedTrace = collections.namedtuple('StreamedTrace', [
+    'index', 'timestamp', 'trace', 'max_hold', 'min_hold', 'average', 'count', 'dropped'])
+
+
+# segment of FSW.scan_segments(), rbw None: auto
+Segment = collections.namedtuple('Segment', ['f_center', 'f_span', 'rbw', 'N_points'], defaults=[None, 1001])
+
+
+def stitch_segments(parts, overlap='mid'):
+    # Joins the (freq, values) of several segments into one spectrum with
+    # increasing frequency. Where two segments overlap, the lower one is
+    # used up to the cut frequency and the upper one above: 'mid' cuts in
+    # the middle of the overlap, 'first' keeps all of the lower and 'last'
+    # all of the upper segment.
+    if overlap not in ('mid', 'first', 'last'):
+        raise ValueError("Unknown overlap '{}', use 'mid', 'first' or 'last'".format(overlap))
+    parts = sorted(parts, key=lambda part: part[0][0])
+    cuts = [-np.inf]
+    for (freq_a, _), (freq_b, _) in zip(parts[:-1], parts[1:]):
+        a_stop, b_start = freq_a[-1], freq_b[0]
+        if b_start > a_stop:
+            cuts.append(b_start)  # gap, nothing to cut
+        elif overlap == 'mid':
+            cuts.append((a_stop + b_start)/2)
+        elif overlap == 'first':
+            cuts.append(np.nextafter(a_stop, np.inf))
+        else:
+            cuts.append(b_start)
+    cuts.append(np.inf)
+
+    freqs = []
+    values = []
+    for (freq, trace), low, high in zip(parts, cuts[:-1], cuts[1:]):
+        keep = (freq >= low) & (freq < high)
+        freqs.append(freq[keep])
+        values.append(trace[keep])
+    return np.concatenate(freqs), np.concatenate(values)
+
+
+class SettingsCache:
+    # Last known instrument state, keyed by the SCPI header. Only valid as
+    # long as all settings go through FSW (configure, write_setting), has to
+    # be cleared after *RST, preset, setup recall and reconnect.
+
+    def __init__(self):
+        self.values = {}
+        self.read_back = set()  # keys of values read from the instrument
+        self.version = 0  # changes whenever a value changes
+
+    def key(self, header):
+        header = header.strip().upper().lstrip(':')
+        if header.startswith('SENS:'):
+            header = header[5:]
+        return header
+
+    def get(self, header, default=None):
+        return self.values.get(self.key(header), default)
+
+    def matches(self, header, value):
+        # A value read back while the auto coupling of the setting (e.g.
+        # BAND:AUTO) was on or unknown does not match: writing the same value
+        # switches the auto coupling off.
+        key = self.key(header)
+        if key not in self.values or not values_match(self.values[key], value):
+            return False
+        auto = key + ':AUTO'
+        if key in self.read_back and auto in COUPLED_SETTINGS:
+            return auto in self.values and values_match(self.values[auto], 0)
+        return True
+
+    def update(self, header, value, coupled=True):
+        # coupled=False for values read from the instrument, they do not
+        # change any other setting
+        key = self.key(header)
+        if coupled:
+            self.read_back.discard(key)
+            if key + ':AUTO' in COUPLED_SETTINGS:
+                # a manual value switches the auto coupling off
+                self.values[key + ':AUTO'] = 0.0
+        else:
+            self.read_back.add(key)
+        if key in self.values and values_match(self.values[key], value):
+            return
+        for coupled_key in COUPLED_SETTINGS.get(key, []) if coupled else []:
+            if coupled_key != key + ':AUTO':
+                self.values.pop(coupled_key, None)
+                self.read_back.discard(coupled_key)
+        self.values[key] = parse_value(value)
+        self.version += 1
+
+    def invalidate(self, header=None):
+        self.version += 1
+        if header is None:
+            self.values.clear()
+            self.read_back.clear()
+        else:
+            # the setting may have been applied, with its coupled settings
+            key = self.key(header)
+            for unknown in [key] + COUPLED_SETTINGS.get(key, []):
+                self.values.pop(unknown, None)
+                self.read_back.discard(unknown)
+
 
 class FSW:
 
     def __init__(self):
 
         self.ip = '192.168.0.61'
+        self.transport = 'visa'  # 'visa' or 'socket' (raw TCP, without VISA)
+        self.port = 5025  # only for transport 'socket'
+        # only for transport 'socket', e.g. {'nodelay': True, 'rcvbuf': 4 << 20},
+        # see SocketInstrument
+        self.socket_options = {}
+        self.resource = None  # VISA resource string, default 'TCPIP::' + ip
+        self.visa_options = None  # e.g. 'SelectVisa=socket'
         self.path = '.'
         self.f_center = None
         self.f_span = None
         self.N_points = None
+        self.trace_format = 'REAL,32'
+        self.trace_buffer = None
+        self.writer = None
+        self.dataset = None  # scan dataset, see open_dataset
+        self.store = None  # memory-mapped trace store, see open_store
+        self.catalog = None  # SQLite catalog of the measurements, see open_catalog
+        self.marker_mode = 'instrument'  # 'instrument' or 'trace'
+        self.peak_interpolation = False
+        self.freq_axis = None
+        self.roi = None  # region of interest, see set_roi
+        self.roi_follow = False
+        self.partial_read = True  # TRAC:DATA:MEM? for the region of interest
+        self.last_peak = None  # frequency of the last max marker
+        self.last_location = (None, None)  # (file, row) of the last trace, see store_trace
+        self.last_marker = (None, None)  # (x, y) of the last max marker
+        self.zoom = None  # coarse/fine measurement, see set_zoom
+        self.zoom_fine = None  # fine settings of the last position
+        self.zoom_coarse_count = 0  # number of coarse sweeps
+        self.segment_reverse = False  # scan_segments: direction of the next scan
+        self.cache = SettingsCache()
+        self.parameters = None
+        self.parameters_version = None
+        self.trace_every = 10  # mode 'both': store every n-th trace
+        # 'opc': *OPC? after INIT, 'wai': INIT;*WAI, 'stb': INIT;*OPC and
+        # status byte polling (see sweep_async)
+        self.sweep_sync = 'opc'
+        self.timing = {}  # durations in s of the stages of the last measure()
+        self.profiler = None
+        # 'command': driver checks the error queue after every command
+        # 'batch': once after every configure() and measure()
+        # 'sweep': once per measure(), n (int): after every n commands
+        self.error_check = 'command'
+        self.error_checker = None
+        self.measure_count = 0
+        self.session = None  # driver, without profiling and error checking
+        self.instr = None
 
 
     def init(self):
 
         RsInstrument.assert_minimum_version('1.53.0')
         try:
-            # Adjust the VISA Resource string to fit your instrument
-            instr = RsInstrument('TCPIP::' + self.ip + '', id_query=True, reset=False)
+            if self.transport == 'socket':
+                instr = SocketInstrument(self.ip, self.port, **self.socket_options)
+            else:
+                # Adjust the VISA Resource string to fit your instrument
+                resource = self.resource or 'TCPIP::' + self.ip + ''
+                instr = RsInstrument(resource, id_query=True, reset=False, options=self.visa_options)
             instr.visa_timeout = 20000  # Timeout for VISA Read Operations
             instr.opc_timeout = 20000  # Timeout for opc-synchronised operations
-            instr.instrument_status_checking = True  # Error check after each command
+            # Error check after each command, or deferred (see set_error_check)
+            instr.instrument_status_checking = self.error_check == 'command'
         except Exception as ex:
-            print('Error initializing the instrument session:\n' + ex.args[0])
+            print('Error initializing the instrument session:\n' + str(ex))
             return
 
-        self.instr = instr
+        self.session = instr
+        self.error_checker = None
+        self.wrap_instr()
+        self.cache.invalidate()  # new session, state of the instrument unknown
 
         idn = self.instr.query_str('*IDN?')
         print('Hello, I am: ' + idn)
 
         self.debug(True)
+        self.set_trace_format(self.trace_format)
         # self.continuous_sweep(False)
         # self.get_parameter()
 
     def get_parameter(self):
 
-        # functionality not tested
-        self.f_center = self.instr.query_float('FREQ:CENT?')
-        self.f_span = self.instr.query_float('FREQ:SPAN?')
-        self.N_points = self.instr.query_float('SWE:POIN?')
+        # Snapshot of the measurement state (Parameters). Only refreshed if
+        # the settings cache changed, values not in the cache are read with
+        # one chained query.
+        if self.parameters is not None and self.parameters_version == self.cache.version:
+            return self.parameters
+
+        missing = [header for field, header, label in PARAMETERS if self.cache.get(header) is None]
+        if missing:
+            query = ';:'.join(header + '?' for header in missing)
+            answers = self.instr.query_str(query).split(';')
+            for header, answer in zip(missing, answers):
+                self.cache.update(header, answer.strip(), coupled=False)
+
+        values = {}
+        for field, header, label in PARAMETERS:
+            kind = Parameters.__annotations__[field]  # float, int or str
+            values[field] = kind(self.cache.get(header))
+
+        self.parameters = Parameters(**values)
+        self.parameters_version = self.cache.version
+        self.f_center = self.parameters.f_center
+        self.f_span = self.parameters.f_span
+        self.N_points = self.parameters.N_points
+        return self.parameters
+
+
+    def write_setting(self, header, value):
+        # write a single setting, skipped if the instrument already has it
+        if self.cache.matches(header, value):
+            return False
+        try:
+            self.instr.write_str('{} {}'.format(header, value))
+        except Exception:
+            self.cache.invalidate(header)  # may be applied anyway
+            raise
+        self.cache.update(header, value)
+        return True
+
+
+    def reset(self):
+        # *RST also sets the trace format back to ASCII
+        self.instr.reset()
+        self.cache.invalidate()
+        self.set_trace_format(self.trace_format)
+
 
-        
-        # print(f_center, type(f_center))
-        # print(f_span, type(f_center))
-        # print(N_points, type(f_center))
-        return 
+    def preset(self):
+        self.instr.write_str_with_opc('SYST:PRES')
+        self.cache.invalidate()
+        self.set_trace_format(self.trace_format)
 
-        # self.f_center = f_center
-        # self.f_span = f_center
-        # self.N_points = f_center
 
+    def recall_setup(self, instr_file):
+        # setup file on the instrument, e.g. r'c:\temp\setup.dfl'
+        self.instr.write_str_with_opc("MMEM:LOAD:STAT 1,'{}'".format(instr_file))
+        self.cache.invalidate()
+        self.set_trace_format(self.trace_format)
+
+
+    def set_trace_format(self, trace_format='REAL,32'):
+        # 'ASCII', 'REAL,32' or 'REAL,64', the format is sent once and not
+        # with every trace query
+        trace_format = trace_format.upper().replace(' ', '')
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError("Unknown trace format '{}', use one of {}".format(
+                trace_format, ', '.join(TRACE_FORMATS)))
+
+        self.trace_format = trace_format
+        if self.instr is None:
+            return
+
+        form, bin_format = TRACE_FORMATS[trace_format]
+        self.instr.write_str('FORM {}'.format(form))
+        if bin_format is not None:
+            # tells the driver in which format to expect the binary float data
+            self.instr.bin_float_numbers_format = bin_format
+        print('trace format {}'.format(trace_format))
+
+
+    def fetch_trace(self, trace=1, out=None, window=None):
+        # Fetch a trace as float32 array. In binary format the data block is
+        # decoded with np.frombuffer directly into 'out' (no list of python
+        # floats), so a scan can reuse one preallocated buffer for all sweeps.
+        # window=(offset, count): only these points, read with
+        # TRAC:DATA:MEM? or sliced on the host if the instrument does not
+        # support the partial read.
+        if window is None:
+            return self.read_trace('TRAC? TRACE{}'.format(trace), out)
+
+        offset, count = window
+        if self.partial_read:
+            try:
+                return self.read_trace('TRAC:DATA:MEM? TRACE{},{},{}'.format(trace, offset, count), out)
+            except Exception as ex:
+                print('partial trace read failed, trace is sliced on the host:\n' + str(ex))
+                self.partial_read = False
+                if self.error_checker is not None:
+                    try:
+                        self.check_errors()  # error of the partial read
+                    except InstrumentError:
+                        pass
+        return self.read_trace('TRAC? TRACE{}'.format(trace), out)[offset:offset + count]
+
+
+    def read_trace(self, query, out=None):
+        if self.trace_format == 'REAL,32' and out is not None and hasattr(self.instr, 'query_bin_block_into'):
+            # raw socket: the block is received directly into out
+            if out.dtype != np.float32:
+                raise ValueError('out has to be a float32 array')
+            return out[:self.instr.query_bin_block_into(query, out)//4]
+
+        if self.trace_format == 'ASCII':
+            values = np.array(self.instr.query_str(query).split(','), dtype=np.float32)
+        else:
+            dtype = '<f4' if self.trace_format == 'REAL,32' else '<f8'
+            values = np.frombuffer(self.instr.query_bin_block(query), dtype=dtype)
+
+        if out is None:
+            return values.astype(np.float32)
+        if out.dtype != np.float32 or out.size < values.size:
+            raise ValueError('out has to be a float32 array with at least {} elements'.format(values.size))
+        trace = out[:values.size]
+        np.copyto(trace, values, casting='same_kind')
+        return trace
+
+
+    def fetch_traces(self, traces=(1, 2, 3), out=None):
+        # Fetch several traces with one chained query ('TRAC? TRACE1;:TRAC?
+        # TRACE2;...') as 2D float32 array [trace, point]. Over the raw
+        # socket the binary blocks are read in one pass straight into the
+        # rows of 'out'. Returns the array and the list of detector and trace
+        # mode of every trace, e.g. {'trace': 2, 'detector': 'POS', 'mode':
+        # 'MAXH'} (settings cache, missing values are read with one query).
+        traces = list(traces)
+        info = self.trace_info(traces)
+        n_points = int(self.get_parameter().N_points)
+        if out is None:
+            out = np.empty((len(traces), n_points), dtype=np.float32)
+        if out.dtype != np.float32 or out.ndim != 2 or out.shape[0] < len(traces) or out.shape[1] < n_points:
+            raise ValueError('out has to be a float32 array of at least {}x{}'.format(len(traces), n_points))
+        out = out[:len(traces), :n_points]
+        query = ';:'.join('TRAC? TRACE{}'.format(trace) for trace in traces)
+
+        if self.trace_format == 'REAL,32' and hasattr(self.instr, 'query_bin_blocks_into'):
+            lengths = self.instr.query_bin_blocks_into(query, out)
+            if any(length != 4*n_points for length in lengths):
+                raise ValueError('expected {} points per trace, got {}'.format(n_points, [length//4 for length in lengths]))
+        elif self.trace_format == 'ASCII':
+            for row, values in zip(out, self.instr.query_str(query).split(';')):
+                row[:] = np.array(values.split(','), dtype=np.float32)
+        else:
+            # the driver reads only one binary block per query
+            for row, trace in zip(out, traces):
+                self.fetch_trace(trace, out=row)
+        return out, info
+
+
+    def trace_info(self, traces):
+        # detector and trace mode of the traces (trace 1 uses the headers of
+        # PARAMETERS)
+        headers = {}
+        for trace in traces:
+            suffix = '' if trace == 1 else str(trace)
+            headers[trace] = ('DET' + suffix, 'DISP:WIND:TRAC{}:MODE'.format(suffix))
+        missing = [header for trace in traces for header in headers[trace] if self.cache.get(header) is None]
+        if missing:
+            answers = self.instr.query_str(';:'.join(header + '?' for header in missing)).split(';')
+            for header, answer in zip(missing, answers):
+                self.cache.update(header, answer.strip(), coupled=False)
+        return [{'trace': trace, 'detector': self.cache.get(headers[trace][0]),
+                 'mode': self.cache.get(headers[trace][1])} for trace in traces]
 
 
     def debug(self, debug_mode=True):
         if debug_mode:
-            self.instr.write_str('SYST:DISP:UPD ON')  # Display update ON - switch OFF after debugging
+            self.write_setting('SYST:DISP:UPD', 'ON')  # Display update ON - switch OFF after debugging
             print('debug mode on')
         else:
-            self.instr.write_str('SYST:DISP:UPD OFF')  # Display update ON - switch OFF after debugging
+            self.write_setting('SYST:DISP:UPD', 'OFF')  # Display update ON - switch OFF after debugging
             print('debug mode off')
 
 
     def continuous_sweep(self, cont_mode=True):
         if cont_mode:
-            self.instr.write_str('INIT:CONT ON')  # Switch OFF the continuous sweep
+            self.write_setting('INIT:CONT', 'ON')  # Switch OFF the continuous sweep
             print('continuous sweep on')
         else:
-            self.instr.write_str('INIT:CONT OFF')  # Switch OFF the continuous sweep
+            self.write_setting('INIT:CONT', 'OFF')  # Switch OFF the continuous sweep
             print('continuous sweep off')
 
     def basic_config(self):
-        # self.instr.write_str('DISP:WIND:TRAC:Y:RLEV 10.0')  # Setting the Reference Level
-        self.instr.write_str('FREQ:CENT 61.0 GHz')  # Setting the center frequency
-        self.instr.write_str('FREQ:SPAN 1000 MHz')  # Setting the span
-        self.instr.write_str('SWE:POIN 1001')  # Setting the sweep points
-        # old settings
-        # self.instr.write_str('FREQ:SPAN 1000 MHz')  # Setting the span
-        # self.instr.write_str('SWE:POIN 1001')  # Setting the sweep points
-        # self.instr.write_str('BAND 100 kHz')  # Setting the RBW
-        # self.instr.write_str('BAND:VID 300kHz')  # Setting the VBW
-        answer = self.instr.query_opc()  # Using *OPC? query waits until all the instrument settings are finished
+        settings = [
+            # ('DISP:WIND:TRAC:Y:RLEV', '10.0'),  # Setting the Reference Level
+            ('FREQ:CENT', '61.0 GHz'),  # Setting the center frequency
+            ('FREQ:SPAN', '1000 MHz'),  # Setting the span
+            ('SWE:POIN', '1001'),  # Setting the sweep points
+            # old settings
+            # ('FREQ:SPAN', '1000 MHz'),  # Setting the span
+            # ('SWE:POIN', '1001'),  # Setting the sweep points
+            # ('BAND', '100 kHz'),  # Setting the RBW
+            # ('BAND:VID', '300kHz'),  # Setting the VBW
+        ]
+        answer = self.configure(settings)
 
         # maybe better try-catch
         if answer:
@@ -109,10 +569,61 @@ class FSW:
         self.get_parameter()
 
 
+    def configure(self, settings, verify=False, max_length=1024):
+        # Sends a list of settings (header, value) chained in as few messages
+        # as possible and synchronizes once with *OPC? at the end. Settings
+        # the instrument already has (settings cache) are not sent again. With
+        # verify all values are read back with one chained query, settings
+        # that do not match are printed and False is returned.
+        batch = CommandBatch(max_length)
+        changed = set()  # settings changed by the settings sent before
+        for header, value in settings:
+            key = self.cache.key(header)
+            if verify or key in changed or not self.cache.matches(header, value):
+                batch.add(header, value)
+                changed.update(COUPLED_SETTINGS.get(key, []))
+                changed.discard(key)
+        if not batch.settings:
+            return True
+
+        try:
+            for message in batch.messages():
+                self.instr.write_str(message)
+            answer = self.instr.query_opc()  # Using *OPC? query waits until all the instrument settings are finished
+            if self.error_check == 'batch':
+                self.check_errors()
+        except Exception:
+            # a part of the batch may be applied, the instrument state of
+            # these settings is unknown
+            for header, value in batch.settings:
+                self.cache.invalidate(header)
+            raise
+
+        for header, value in batch.settings:
+            if answer:
+                self.cache.update(header, value)
+            else:
+                self.cache.invalidate(header)
+
+        if verify and answer:
+            answers = []
+            for query in batch.queries():
+                answers += self.instr.query_str(query).split(';')
+            for (header, value), answer_value in zip(batch.settings, answers):
+                # the cache keeps what the instrument really has
+                self.cache.update(header, answer_value, coupled=False)
+                if not values_match(value, answer_value):
+                    print("setting '{} {}' not applied, instrument has '{}'".format(header, value, answer_value))
+                    answer = False
+
+        return bool(answer)
+
+
     def set_path(self, path='.'):
         path = path.replace('\\', '/').replace('/', os.sep)
         if os.path.isdir(path):
             self.path = path
+            self.measure_count = 0  # new scan, 'both' starts with a trace
             print("Set path to '{}'".format(self.path))
             return True
         else:
@@ -120,7 +631,14 @@ class FSW:
             return False
 
 
-    def measure(self, name=''):
+    def measure(self, name='', mode='trace'):
+        # mode 'trace': full trace to a file per measurement
+        # mode 'peak': only the max marker, appended to the peak table of the
+        #              scan (no trace transfer, no file per measurement)
+        # mode 'both': peak table and every trace_every-th trace as file
+
+        if mode not in ('trace', 'peak', 'both'):
+            raise ValueError("Unknown mode '{}', use 'trace', 'peak' or 'both'".format(mode))
 
         if name == '':
             name = datetime.datetime.now().strftime('FSW_%Y_%m_%d_%H-%M-%S.txt')
@@ -131,10 +649,35 @@ class FSW:
         if not name.endswith('.txt'):
             name += '.txt'
 
-        self.instr.write_str_with_opc('INIT')  # Start the sweep and wait for it to finish
-
-        trace = self.instr.query_bin_or_ascii_float_list('FORM ASC;:TRAC? TRACE1')  # Query ascii array of floats
-        marker_x, marker_y = self.marker_xy()
+        self.get_parameter()  # no round trip if the settings did not change
+        self.timing = {}
+        if self.zoom is not None:
+            marker = self.zoom_sweep()  # coarse (if needed) and fine sweep
+        else:
+            marker = None
+            self.sweep()  # Start the sweep and wait for it to finish
+
+        full_trace = mode == 'trace' or (mode == 'both' and self.measure_count % self.trace_every == 0)
+        self.measure_count += 1
+
+        t = time.perf_counter()
+        if full_trace:
+            window = self.roi_window()
+            trace = self.fetch_trace(1, out=self.next_buffer(), window=window)
+            self.timing['transfer'] = time.perf_counter() - t
+            t = time.perf_counter()
+        if marker is not None:
+            marker_x, marker_y = marker  # already read by zoom_sweep
+        elif full_trace and self.marker_mode == 'trace':
+            # no extra round trips, the trace is already on the host
+            marker_x, marker_y = self.peak_xy(trace, offset=0 if window is None else window[0])
+        else:
+            marker_x, marker_y = self.marker_xy()
+        self.timing['marker'] = time.perf_counter() - t
+        self.last_peak = marker_x
+        if self.error_check in ('batch', 'sweep'):
+            # one error query for all commands of the measurement
+            self.check_errors()
 
 
         date_time = datetime.datetime.now().strftime('%d.%m.%Y, %H:%M:%S')
@@ -151,33 +694,477 @@ class FSW:
         # marker_x, marker_y = 10, 10
 
 
-        f_path = self.path + os.sep + name
-        file = open(f_path, 'w')
-        file.write('# FSW Measurement\n')
-        file.write('# File name: {}\n'.format(name))
-        file.write('# Date: {}\n'.format(date_time))
-        file.write('# Frequency Center: {}\n'.format(self.f_center))
-        file.write('# Frequency Span: {}\n'.format(self.f_span))
-        file.write('# Number Points: {}\n'.format(self.N_points))
-        file.write('# Max Marker X: {}\n'.format(marker_x))
-        file.write('# Max Marker Y: {}\n'.format(marker_y))
-        file.write('# Values of trace\n'.format(marker_y))
-        
-        for value in trace:
-            file.write('{}\n'.format(value))
+        t = time.perf_counter()
+        if mode != 'trace':
+            append_peak(self.path, name, date_time, marker_x, marker_y)
+        self.last_marker = (marker_x, marker_y)
+        if not full_trace:
+            self.last_location = (None, None)
+            self.catalog_measurement(name, None, None, marker_x, marker_y)
+            self.timing['write'] = time.perf_counter() - t
+            return
 
+        f_path = self.path + os.sep + name
+        header = [
+            ('File name', name),
+            ('Date', date_time),
+            ('Frequency Center', self.f_center),
+            ('Frequency Span', self.f_span),
+            ('Number Points', self.N_points),
+            ('Max Marker X', marker_x),
+            ('Max Marker Y', marker_y),
+        ]
+        if window is not None:
+            # the file has only the points of the region of interest
+            header += [('ROI Offset', window[0]), ('ROI Points', trace.size)]
+        if self.parameters is not None:
+            # the rest of the measurement state
+            for field, header_scpi, label in PARAMETERS:
+                if field not in ('f_center', 'f_span', 'N_points'):
+                    header.append((label, getattr(self.parameters, field)))
+
+        offset = 0 if window is None else window[0]
+        freq = self.frequency_axis()[offset:offset + trace.size]
+        location, row = self.store_trace(f_path, name, trace, freq, marker_x, marker_y, header)
+        self.last_location = (location, row)
+        self.catalog_measurement(name, location, row, marker_x, marker_y)
+        self.timing['write'] = time.perf_counter() - t
+        if self.profiler is not None:
+            self.profiler.span('host:write', t, self.timing['write'])
 
         return
 
 
-        # binary format, maybe this is useful too
+    def scan_segments(self, segments, overlap='mid'):
+        # Sweeps a list of segments (Segment or (f_center, f_span, rbw,
+        # N_points)) and returns the stitched frequency axis and spectrum
+        # (float32), see stitch_segments. Every segment is configured with
+        # one message and only the settings that change are sent. The order
+        # is reversed from call to call, so the settings of the last segment
+        # are still valid for the first segment of the next position.
+        segments = [Segment(*segment) for segment in segments]
+        order = list(range(len(segments)))
+        if self.segment_reverse:
+            order.reverse()
+        self.segment_reverse = not self.segment_reverse
+
+        parts = []
+        for i in order:
+            segment = segments[i]
+            self.configure([
+                ('FREQ:CENT', segment.f_center),
+                ('FREQ:SPAN', segment.f_span),
+                ('SWE:POIN', int(segment.N_points)),
+                ('BAND', segment.rbw) if segment.rbw is not None else ('BAND:AUTO', 'ON'),
+            ])
+            self.get_parameter()
+            self.sweep()
+            parts.append((self.frequency_axis(), self.fetch_trace(1)))
+        return stitch_segments(parts, overlap)
+
+
+    def measure_segments(self, segments, name='', overlap='mid'):
+        # scan_segments and one file for the position (stitched spectrum),
+        # the frequency range of every segment is in the header
+        if name == '':
+            name = datetime.datetime.now().strftime('FSW_%Y_%m_%d_%H-%M-%S.txt')
+        if not name.endswith('.txt'):
+            name += '.txt'
 
-        # instr.bin_float_numbers_format = BinFloatFormat.Single_4bytes  # This tells the driver in which format to expect the binary float data
-        # trace = instr.query_bin_or_ascii_float_list('FORM REAL,32;:TRAC? TRACE1')  # Query binary array of floats - the query function is the same as for the ASCII format
-        # # print(f'Instrument returned {len(trace)} points in the binary trace, query duration {time() - t:.3f} secs')
+        self.timing = {}
+        t = time.perf_counter()
+        freq, spectrum = self.scan_segments(segments, overlap)
+        self.timing['segments'] = time.perf_counter() - t
+        i = int(np.argmax(spectrum))
+        marker_x, marker_y = float(freq[i]), float(spectrum[i])
+        self.last_peak = marker_x
+        date_time = datetime.datetime.now().strftime('%d.%m.%Y, %H:%M:%S')
+
+        t = time.perf_counter()
+        header = [
+            ('File name', name),
+            ('Date', date_time),
+            ('Frequency Start', float(freq[0])),
+            ('Frequency Stop', float(freq[-1])),
+            ('Number Points', spectrum.size),
+            ('Max Marker X', marker_x),
+            ('Max Marker Y', marker_y),
+        ]
+        for k, segment in enumerate(Segment(*segment) for segment in segments):
+            header.append(('Segment {}'.format(k + 1), '{} Hz center, {} Hz span, {} RBW, {} points'.format(
+                segment.f_center, segment.f_span, segment.rbw or 'auto', segment.N_points)))
+        f_path = self.path + os.sep + name
+        location, row = self.store_trace(f_path, name, spectrum, freq, marker_x, marker_y, header)
+        self.last_location = (location, row)
+        self.last_marker = (marker_x, marker_y)
+        self.catalog_measurement(name, location, row, marker_x, marker_y)
+        self.timing['write'] = time.perf_counter() - t
+        return freq, spectrum
+
+
+    def scan(self, positions, move=None, mode='trace', name='scan_{}_{}', check_last=8):
+        # Measures every (az, el) of positions with measure(name.format(az,
+        # el), mode), move(az, el) turns the positioner. Every finished
+        # position is recorded in the journal of the scan folder
+        # (fsw_journal.py). If the scan is started again (after a crash or a
+        # lost connection) the finished positions are skipped and the last
+        # traces are checked, incomplete ones are measured again.
+        journal = ScanJournal(self.path + os.sep + JOURNAL)
+        redo = journal.verify(check_last)
+        if len(journal) or redo:
+            print('resuming scan: {} positions done, measuring again: {}'.format(
+                len(journal), ', '.join(redo) if redo else 'none'))
+
+        measured = 0
+        skipped = 0
+        try:
+            for az, el in positions:
+                full_name = name.format(az, el) + '.txt'
+                if full_name in journal.done:
+                    skipped += 1
+                    continue
+                if move is not None:
+                    move(az, el)
+                journal.begin(full_name)
+                self.measure(full_name, mode)
+                location, row = self.last_location
+                marker_x, marker_y = self.last_marker
+                journal.complete(full_name, az, el, location, row, marker_x, marker_y)
+                measured += 1
+        finally:
+            journal.close()
+        print('scan finished: {} positions measured, {} skipped'.format(measured, skipped))
+
+
+    def sweep(self):
+        # single sweep, returns when it is finished
+        if self.sweep_sync == 'stb':
+            future = self.sweep_async()
+            t = time.perf_counter()
+            future.result()
+            self.timing['sweep'] = time.perf_counter() - t
+            return
+        t = time.perf_counter()
+        if self.sweep_sync == 'wai':
+            # the instrument holds back the next command until the sweep is
+            # done, the waiting time is part of the following query
+            self.instr.write_str('INIT;*WAI')
+            self.timing['arm'] = time.perf_counter() - t
+            return
+        self.instr.write_str('INIT')
+        self.timing['arm'] = time.perf_counter() - t
+        t = time.perf_counter()
+        self.instr.query_opc()
+        self.timing['sweep'] = time.perf_counter() - t
+
+
+    def arm_status(self):
+        # operation complete -> event status bit -> service request, only
+        # sent once (settings cache). The event status register is cleared
+        # before every sweep, an operation complete bit of an earlier sweep
+        # (e.g. after a timeout) would end the next wait at once. Returns the
+        # old value, its error bits are not lost. Not with *CLS, that would
+        # also clear the error queue.
+        self.write_setting('*ESE', 1)
+        self.write_setting('*SRE', 32)
+        return int(self.instr.query_str('*ESR?'))
+
+
+    def sweep_async(self, callback=None):
+        # Starts a single sweep with 'INIT;*OPC' and returns a
+        # concurrent.futures.Future, done when the sweep is complete (result:
+        # time from the start of the sweep in s, callback(future) is called
+        # then). The status byte is polled on a background thread, so the
+        # positioner can be moved or the last trace processed in the
+        # meantime. Do not use the instrument until the future is done.
+        parameters = self.get_parameter()
+        old_esr = self.arm_status()
+        expected = parameters.sweep_time*max(parameters.sweep_count, 1)
+        session = self.session
+        waiter = SweepWaiter(session, expected, expected + session.opc_timeout/1000)
+        future = concurrent.futures.Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        t = time.perf_counter()
+        self.instr.write_str('INIT;*OPC')
+        self.timing['arm'] = time.perf_counter() - t
+
+        def run():
+            status_checking = session.instrument_status_checking
+            session.instrument_status_checking = False  # no error query after every *STB?
+            try:
+                esr = waiter.wait() | old_esr
+                duration = time.perf_counter() - t
+                if self.profiler is not None:
+                    self.profiler.span('sweep:stb', t, duration)
+                if esr & ESR_ERRORS:
+                    # error bits stay set until *ESR?, they can also be from
+                    # errors that were already reported
+                    self.check_errors()
+                    errors = parse_errors(session.query_str('SYST:ERR:ALL?'))
+                    if errors:
+                        raise InstrumentError('instrument reported errors: ' + ', '.join(
+                            '{},"{}"'.format(code, message) for code, message in errors))
+                future.set_result(duration)
+            except Exception as ex:
+                try:
+                    session.query_str('*ESR?')  # no operation complete bit left for the next sweep
+                except Exception:
+                    pass
+                future.set_exception(ex)
+            finally:
+                session.instrument_status_checking = status_checking
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+
+    def stream_traces(self, n=None, rate_limit=None):
+        # Generator of the traces of the continuously sweeping analyzer
+        # (INIT:CONT ON, no INIT and no file per trace), n traces or until
+        # the loop is left, at most rate_limit traces per second:
+        #
+        #     for item in fsw.stream_traces(1000):
+        #         print(item.timestamp, item.trace.max(), item.max_hold.max())
+        #
+        # A trace is fetched only after a new sweep has ended: the end of
+        # every sweep sets bit 3 of the STAT:OPER event register (negative
+        # transition of the sweeping bit), it is polled with STAT:OPER:EVEN?
+        # (read and cleared). The same sweep is never fetched twice.
+        # item.index is the number of the sweep since the start and
+        # item.dropped counts the sweeps lost because the host or the link
+        # was too slow, from the cycle time of the continuous sweep (measured,
+        # longer than SWE:TIME because of the re-arm time; sweeps skipped by
+        # rate_limit are not counted). Max hold, min hold and average (of the
+        # dB values) are computed on the host.
+        # item.trace is reused for the next trace, copy it to keep it.
+        parameters = self.get_parameter()
+        n_points = int(parameters.N_points)
+        sweep_time = parameters.sweep_time
+        continuous = self.cache.get('INIT:CONT')
+        if continuous is None:
+            # restored at the end, not known after init()
+            continuous = parse_value(self.instr.query_str('INIT:CONT?'))
+            self.cache.update('INIT:CONT', continuous, coupled=False)
+        buffer = np.empty(n_points, dtype=np.float32)
+        max_hold = np.full(n_points, -np.inf, dtype=np.float32)
+        min_hold = np.full(n_points, np.inf, dtype=np.float32)
+        average = np.zeros(n_points, dtype=np.float64)
+
+        session = self.session
+
+        def sweep_ended():
+            # no error query after every poll
+            status_checking = session.instrument_status_checking
+            session.instrument_status_checking = False
+            try:
+                return bool(int(session.query_str('STAT:OPER:EVEN?')) & 8)
+            finally:
+                session.instrument_status_checking = status_checking
+
+        def wait_sweep_end(interval):
+            # returns the number of polls that found no new sweep end
+            polls = 0
+            while not sweep_ended():
+                polls += 1
+                time.sleep(interval)
+            return polls
+
+        self.write_setting('STAT:OPER:PTR', 0)
+        self.write_setting('STAT:OPER:NTR', 8)
+        sweep_ended()  # clears old events
+        self.write_setting('INIT:CONT', 'ON')
+        start = time.perf_counter()
+        wall_start = time.time()
+        # the sweep running at the start is not used, the next sweep end
+        # gives the cycle time
+        wait_sweep_end(min(max(sweep_time/20, 0.0005), 0.05))
+        cycle = None  # time between two sweep ends, shortest measured
+        last_end = time.perf_counter()
+        last_index = 0
+        count = 0
+        dropped = 0
+        try:
+            while n is None or count < n:
+                # not before the rate limit and the expected end of the sweep
+                # (earlier while the cycle time is not measured yet)
+                t = last_end + (0.9*cycle if cycle else 0.5*sweep_time)
+                if rate_limit and count:
+                    t = max(t, last_end + 1/rate_limit)
+                delay = t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                scheduled = time.perf_counter()
+
+                polls = wait_sweep_end(min(max((cycle or sweep_time)/20, 0.0005), 0.05))
+                end = time.perf_counter()
+
+                if polls:
+                    # waited for it: the first sweep end since the last one
+                    cycle = end - last_end if cycle is None else min(cycle, end - last_end)
+                    ends = 1
+                elif cycle:
+                    # ended before the first poll, maybe more than one sweep
+                    ends = max(int((end - last_end)/cycle), 1)
+                    # sweeps that ended during the pause of the rate limit
+                    skipped = int(min(scheduled - last_end, 1/rate_limit)/cycle) if rate_limit else 0
+                    dropped += max(ends - 1 - skipped, 0)
+                else:
+                    ends = 1
+                index = last_index + ends
+                trace = self.fetch_trace(1, out=buffer)
+                timestamp = wall_start + (end - start)
+
+                last_end = end
+                last_index = index
+                count += 1
+                np.maximum(max_hold, trace, out=max_hold)
+                np.minimum(min_hold, trace, out=min_hold)
+                average += (trace - average)/count
+                yield StreamedTrace(index, timestamp, trace, max_hold, min_hold, average, count, dropped)
+        finally:
+            if continuous == 0:
+                self.write_setting('INIT:CONT', 'OFF')
+            duration = time.perf_counter() - start
+            print('stream: {} traces in {:.1f} s, {} sweeps dropped'.format(count, duration, dropped))
+
+
+    def next_buffer(self):
+        # buffer for the next trace, None if the number of points is unknown
+        if self.N_points is None:
+            return None
+        n_points = int(self.N_points)
+        if self.writer is not None:
+            # the trace is still in use until the writer is done with it
+            return self.writer.buffer(n_points)
+
+        # one buffer for all measurements, only reallocated if the number of
+        # points changes
+        if self.trace_buffer is None or self.trace_buffer.size != n_points:
+            self.trace_buffer = np.empty(n_points, dtype=np.float32)
+        return self.trace_buffer
+
+
+    def start_pipeline(self, queue_size=4, process=None, durability=None):
+        # Pipelined measurement: the files are written (and optionally post
+        # processed with process(trace, header)) on a background thread while
+        # measure() already starts the next sweep. At most queue_size
+        # measurements wait for the disk before measure() blocks, the waiting
+        # ones are written in one batch. durability: None, 'trace' or n,
+        # fsync of every file or of every n files (see fsw_writer.py).
+        if self.writer is not None:
+            self.stop_pipeline()
+        self.writer = MeasurementWriter(queue_size, process, durability)
+        print('pipeline started, durability: {}'.format(durability))
+
+
+    def stop_pipeline(self):
+        # waits until all measurements are written
+        if self.writer is None:
+            return
+        writer, self.writer = self.writer, None
+        writer.close()
+        print('pipeline stopped, {} measurements written in {} batches'.format(writer.count, writer.batches))
+
+
+    def store_trace(self, f_path, name, trace, freq, marker_x, marker_y, header):
+        # A row of the scan dataset and / or the trace store if they are
+        # open, otherwise a text file. Returns where the trace is (file, row),
+        # row is None for a text file.
+        timestamp = time.time()
+        location = None
+        if self.store is not None:
+            location = (os.path.join(self.store.path, STORE_DATA), len(self.store))
+            self.store.append(name, trace, freq, timestamp, marker_x, marker_y, header)
+        if self.dataset is not None:
+            location = (self.dataset.f_path, len(self.dataset))
+            self.dataset.append(name, trace, freq, timestamp, marker_x, marker_y, header)
+        if location is not None:
+            return location
+        if self.writer is None:
+            write_measurement(f_path, trace, header)
+        else:
+            # written on the background thread, the next sweep can start
+            self.writer.put(f_path, trace, header)
+        return f_path, None
+
+
+    def catalog_measurement(self, name, location, row, marker_x, marker_y):
+        # one row in the catalog, if there is one
+        if self.catalog is None:
+            return
+        az, el = position_of(name)
+        parameters = dataclasses.asdict(self.parameters) if self.parameters is not None else None
+        self.catalog.add(os.path.abspath(self.path), name, location, row, az, el, time.time(), parameters,
+                         marker_x, marker_y)
+
+
+    def open_catalog(self, f_path=None):
+        # Every measurement of measure() is recorded in the SQLite catalog
+        # (fsw_catalog.py), default FSW_catalog.sqlite in the scan folder. A
+        # catalog can be shared by several scans.
+        self.close_catalog()
+        if f_path is None:
+            f_path = self.path + os.sep + CATALOG
+        self.catalog = MeasurementCatalog(f_path)
+        print("catalog '{}', {} measurements".format(f_path, len(self.catalog)))
+
+
+    def close_catalog(self):
+        if self.catalog is None:
+            return
+        catalog, self.catalog = self.catalog, None
+        print('catalog closed, {} measurements'.format(len(catalog)))
+        catalog.close()
+
+
+    def open_store(self, path=None):
+        # Full traces of measure() go to the memory-mapped trace store
+        # (fsw_tracestore.py) in the folder, default the scan folder. Rows
+        # are appended to an existing store.
+        self.close_store()
+        self.store = TraceStoreWriter(self.path if path is None else path)
+        print("trace store '{}', {} measurements".format(self.store.path, len(self.store)))
+
+
+    def close_store(self):
+        if self.store is None:
+            return
+        store, self.store = self.store, None
+        store.close()
+        print('trace store closed, {} measurements'.format(len(store)))
+
+
+    def open_dataset(self, f_path=None):
+        # Full traces of measure() go to one scan dataset (fsw_dataset.py)
+        # instead of a text file per position, default FSW_scan.h5 in the
+        # scan folder. Rows are appended to an existing dataset.
+        self.close_dataset()
+        if f_path is None:
+            f_path = self.path + os.sep + DATASET
+        try:
+            self.dataset = ScanDataset(f_path)
+        except OSError as ex:
+            if not os.path.isfile(f_path):
+                raise
+            # unreadable after a crash: kept under another name, a resumed
+            # scan (FSW.scan) measures its rows again
+            broken = '{}.broken-{}'.format(f_path, datetime.datetime.now().strftime('%Y_%m_%d_%H-%M-%S'))
+            os.replace(f_path, broken)
+            print("dataset '{}' cannot be read ({}), moved to '{}'".format(f_path, ex, broken))
+            self.dataset = ScanDataset(f_path)
+        print("dataset '{}', {} measurements".format(f_path, len(self.dataset)))
+
+
+    def close_dataset(self):
+        if self.dataset is None:
+            return
+        dataset, self.dataset = self.dataset, None
+        print('dataset closed, {} measurements'.format(len(dataset)))
+        dataset.close()
 
 
-        
     def marker_xy(self):
 
         # Set the marker to the maximum point of the entire trace, wait for it to be set
@@ -188,6 +1175,236 @@ class FSW:
         return markerX, markerY
 
 
+    def frequency_axis(self):
+        # frequency of every trace point, only recalculated if the settings
+        # change
+        key = (self.f_center, self.f_span, self.N_points)
+        if self.freq_axis is None or self.freq_axis[0] != key:
+            if None in key:
+                raise RuntimeError('frequency settings unknown, call get_parameter() first')
+            n_points = int(self.N_points)
+            f_start = self.f_center - self.f_span/2
+            f_stop = self.f_center + self.f_span/2
+            self.freq_axis = (key, np.linspace(f_start, f_stop, n_points))
+        return self.freq_axis[1]
+
+
+    def set_zoom(self, span=None, rbw=None, points=201, coarse_points=101, recenter=0.25, max_drop=20):
+        # Two stage measurement in measure(): a fast sweep over the current
+        # (wide) span with coarse_points finds the carrier, then the
+        # analyzer is tuned to span around it with rbw (None: auto) and
+        # points for the level. The fine settings are kept for the next
+        # position as long as the peak stays within recenter*span of the
+        # center and does not drop by more than max_drop dB (carrier left
+        # the span, only noise), only then a new coarse sweep is needed.
+        # span default: 4 points of the coarse sweep.
+        parameters = self.get_parameter()
+        coarse = [
+            ('FREQ:CENT', parameters.f_center),
+            ('FREQ:SPAN', parameters.f_span),
+            ('SWE:POIN', coarse_points),
+            ('BAND:AUTO', 'ON'),
+        ]
+        if span is None:
+            span = 4*parameters.f_span/(coarse_points - 1)
+        auto = self.cache.get('BAND:AUTO')
+        if auto is None:
+            auto = parse_value(self.instr.query_str('BAND:AUTO?'))
+        wide = coarse[:2] + [('SWE:POIN', parameters.N_points),
+                             ('BAND:AUTO', 'ON') if auto == 1 else ('BAND', parameters.rbw)]
+        self.zoom = {'coarse': coarse, 'wide': wide, 'span': span, 'rbw': rbw, 'points': points,
+                     'recenter': recenter, 'max_drop': max_drop, 'level': None}
+        self.zoom_fine = None
+        print('zoom: {} Hz span, {} points'.format(span, points))
+
+
+    def stop_zoom(self):
+        # back to the wide settings of set_zoom
+        if self.zoom is None:
+            return
+        zoom, self.zoom = self.zoom, None
+        self.zoom_fine = None
+        self.configure(zoom['wide'])
+        self.get_parameter()
+        print('zoom off, {} coarse sweeps'.format(self.zoom_coarse_count))
+
+
+    def zoom_sweep(self):
+        # sweep(s) of the zoom measurement, returns the max marker of the
+        # fine sweep
+        zoom = self.zoom
+        if self.zoom_fine is not None:
+            self.configure(self.zoom_fine)  # nothing to send if still tuned
+            self.sweep()
+            marker_x, marker_y = self.marker_xy()
+            if abs(marker_x - self.zoom_fine[0][1]) <= zoom['recenter']*zoom['span'] and \
+                    marker_y >= zoom['level'] - zoom['max_drop']:
+                zoom['level'] = marker_y
+                self.get_parameter()
+                return marker_x, marker_y
+
+        # coarse sweep to find the carrier
+        t = time.perf_counter()
+        self.configure(zoom['coarse'])
+        self.sweep()
+        f_peak = self.marker_xy()[0]
+        self.zoom_coarse_count += 1
+        self.timing['coarse'] = time.perf_counter() - t
+
+        self.zoom_fine = [
+            ('FREQ:CENT', f_peak),
+            ('FREQ:SPAN', zoom['span']),
+            ('SWE:POIN', zoom['points']),
+            ('BAND', zoom['rbw']) if zoom['rbw'] is not None else ('BAND:AUTO', 'ON'),
+        ]
+        self.configure(self.zoom_fine)
+        self.sweep()
+        self.get_parameter()
+        marker_x, marker_y = self.marker_xy()
+        zoom['level'] = marker_y
+        return marker_x, marker_y
+
+
+    def set_roi(self, f_start=None, f_stop=None, offset=None, count=None, follow_peak=False):
+        # Region of interest: measure() transfers and stores only the
+        # frequency window f_start...f_stop (Hz) or the index window (offset,
+        # count points) of the trace. With follow_peak the window keeps its
+        # size but is centered on the last max marker. set_roi() switches it
+        # off.
+        if f_start is not None and f_stop is not None:
+            self.roi = ('frequency', float(f_start), float(f_stop))
+        elif offset is not None and count is not None:
+            self.roi = ('index', int(offset), int(count))
+        elif f_start is None and f_stop is None and offset is None and count is None:
+            self.roi = None
+        else:
+            raise ValueError('give f_start and f_stop or offset and count')
+        self.roi_follow = follow_peak
+        print('region of interest: {}'.format(self.roi))
+
+
+    def roi_window(self):
+        # (offset, count) of the region of interest for the current
+        # settings, None if there is none
+        if self.roi is None:
+            return None
+        freq = self.frequency_axis()
+        kind, a, b = self.roi
+        if kind == 'frequency':
+            offset = int(np.searchsorted(freq, a))
+            count = int(np.searchsorted(freq, b, side='right')) - offset
+        else:
+            offset, count = a, b
+        count = min(max(count, 1), freq.size)
+        if self.roi_follow and self.last_peak is not None:
+            offset = int(np.searchsorted(freq, self.last_peak)) - count//2
+        offset = min(max(offset, 0), freq.size - count)
+        return offset, count
+
+
+    def peak_xy(self, trace, interpolate=None, offset=0):
+        # Frequency and level of the maximum of the trace, the same as
+        # marker_xy() but computed on the host. With interpolation a parabola
+        # through the maximum and its neighbours gives a sub-bin estimate.
+        # offset: index of the first point for a part of the trace (ROI).
+        if interpolate is None:
+            interpolate = self.peak_interpolation
+        freq = self.frequency_axis()[offset:offset + len(trace)]
+        if len(trace) != len(freq):
+            raise ValueError('trace has {} points, expected {}'.format(len(trace), len(freq)))
+
+        i = int(np.argmax(trace))
+        x = float(freq[i])
+        y = float(trace[i])
+        if interpolate and 0 < i < len(trace) - 1:
+            a, b, c = (float(value) for value in trace[i-1:i+2])
+            denominator = a - 2*b + c
+            if denominator != 0:
+                p = 0.5*(a - c)/denominator  # offset in bins, -0.5 ... 0.5
+                x += p*float(freq[1] - freq[0])
+                y = b - 0.25*(a - c)*p
+        return x, y
+
+
+    def check_peak(self, tolerance=0.01):
+        # Compares the host side peak with the instrument marker for the
+        # current trace (no new sweep), returns True if they agree.
+        trace = self.fetch_trace(1)
+        peak_x, peak_y = self.peak_xy(trace, interpolate=False)
+        marker_x, marker_y = self.marker_xy()
+        df = self.f_span/(int(self.N_points) - 1)
+        ok = abs(peak_x - marker_x) <= df/2 and abs(peak_y - marker_y) <= tolerance
+        print('marker: {} Hz, {} dB'.format(marker_x, marker_y))
+        print('peak:   {} Hz, {} dB'.format(peak_x, peak_y))
+        print('peak matches marker' if ok else 'peak does not match marker')
+        return ok
+
+
+    def wrap_instr(self):
+        # self.instr: the driver session, wrapped for profiling and deferred
+        # error checking (the error queries show up in the profile)
+        instr = self.session
+        if self.profiler is not None:
+            instr = InstrumentedInstrument(instr, self.profiler)
+        if self.error_check != 'command':
+            every = self.error_check if isinstance(self.error_check, int) else None
+            if self.error_checker is None:
+                self.error_checker = DeferredErrorCheck(instr, every)
+            else:
+                self.error_checker.attach(instr, every)  # keeps the unchecked commands
+            instr = self.error_checker
+        else:
+            self.error_checker = None
+        self.instr = instr
+
+
+    def set_error_check(self, mode='batch'):
+        # 'command', 'batch', 'sweep' or number of commands, see __init__
+        if mode not in ('command', 'batch', 'sweep') and not (isinstance(mode, int) and mode > 0):
+            raise ValueError("Unknown error check '{}', use 'command', 'batch', 'sweep' or a number".format(mode))
+        if self.error_checker is not None and mode == 'command':
+            self.check_errors()  # errors of the commands sent so far
+        self.error_check = mode
+        if self.session is None:
+            return
+        self.session.instrument_status_checking = mode == 'command'
+        self.wrap_instr()
+        print('error check: {}'.format(mode))
+
+
+    def check_errors(self):
+        # reads the error queue once, raises InstrumentError with the
+        # commands that caused the errors (deferred error check only)
+        if self.error_checker is not None:
+            self.error_checker.check()
+
+
+    def start_profiling(self, size=100000):
+        # records every command sent to the instrument, see fsw_profiling.py
+        if self.profiler is None:
+            self.profiler = ScpiProfiler(size)
+            self.wrap_instr()
+        return self.profiler
+
+
+    def stop_profiling(self):
+        profiler = self.profiler
+        if profiler is not None:
+            self.profiler = None
+            self.wrap_instr()
+        return profiler
+
+
+    @contextlib.contextmanager
+    def profile(self, size=100000):
+        # with fsw.profile() as profiler: ... profile a block of measure() calls
+        profiler = self.start_profiling(size)
+        try:
+            yield profiler
+        finally:
+            self.stop_profiling()
+
+
     def screenshot(self):
         print("method 'screenshot' not implemented")
 
@@ -207,13 +1424,15 @@ class FSW:
         # but I keep it as an option
         # self.instr.reset() 
 
+        self.stop_pipeline()
+        self.close_dataset()
+        self.close_store()
+        self.close_catalog()
         self.instr.close()
         print('connection closed')
         print('reconnect with self.init()')
 
 
-import numpy as np
-
 # for testing
 if __name__ == '__main__':
     IP = '192.168.0.62'
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "test_peak_detection.py"
+
+Host side peak detection (FSW.peak_xy) against the marker of the simulated
+instrument (FSW.marker_xy), run with: python -m pytest test_peak_detection.py
+
+
+"""
+
+
+import pytest
+
+from fsw_simulator import FSWSimulator
+from fswcontrol import FSW
+
+
+@pytest.fixture
+def sim():
+    sim = FSWSimulator(port=0, sweep_time=0.001, seed=1).start()
+    yield sim
+    sim.stop()
+
+
+@pytest.fixture
+def fsw(sim):
+    fsw = FSW()
+    fsw.transport = 'socket'
+    fsw.ip = '127.0.0.1'
+    fsw.port = sim.port
+    fsw.init()
+    yield fsw
+    fsw.close()
+
+
+def measure_peak(sim, fsw, f_carrier, interpolate):
+    # one sweep with the carrier at f_carrier, (peak, marker, bin width)
+    sim.carriers = [(f_carrier, -20.0)]
+    fsw.basic_config()
+    fsw.sweep()
+    trace = fsw.fetch_trace(1)
+    peak = fsw.peak_xy(trace, interpolate=interpolate)
+    marker = fsw.marker_xy()
+    df = fsw.f_span/(int(fsw.N_points) - 1)
+    return peak, marker, df
+
+
+@pytest.mark.parametrize('f_carrier', [61.0e9, 61.1234e9, 60.6e9])
+def test_peak_matches_marker(sim, fsw, f_carrier):
+    (peak_x, peak_y), (marker_x, marker_y), df = measure_peak(sim, fsw, f_carrier, interpolate=False)
+    assert abs(peak_x - marker_x) <= df
+    assert peak_y == pytest.approx(marker_y, abs=0.01)
+
+
+@pytest.mark.parametrize('f_carrier', [61.0e9 + 0.3e6, 61.1234e9, 60.6e9 - 0.4e6])
+def test_interpolated_peak_matches_marker(sim, fsw, f_carrier):
+    (peak_x, peak_y), (marker_x, marker_y), df = measure_peak(sim, fsw, f_carrier, interpolate=True)
+    assert abs(peak_x - marker_x) <= df
+    # the parabola lies between the bins, never below the maximum bin
+    assert peak_y >= marker_y - 0.01
+    # and closer to the carrier than the bin of the marker
+    assert abs(peak_x - f_carrier) <= abs(marker_x - f_carrier) + df/10
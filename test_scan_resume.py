@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Script: "test_scan_resume.py"
+
+Crash and resume of a scan (FSW.scan) with the scan dataset: the scan is
+killed in a child process, the resumed scan measures the positions that are
+missing. A position measured again has one point for the plot. Run with:
+python -m pytest test_scan_resume.py
+
+
+"""
+
+
+import os
+import sys
+import importlib
+import subprocess
+
+import pytest
+
+from fsw_simulator import FSWSimulator
+from fswcontrol import FSW
+from fsw_dataset import DATASET, read_scan
+from fsw_journal import ScanJournal
+from fsw_catalog import CATALOG, MeasurementCatalog
+
+visualization = importlib.import_module('3d_visualization_interpolation')
+
+
+POSITIONS = [(az, el) for el in (-10, 0, 10) for az in (-10, 0, 10)]
+
+# scan with 4 rows per chunk, killed before the 7th position: rows 0 to 3
+# are in the file, rows 4 and 5 were not written yet
+CRASH = '''
+import os, sys
+from fswcontrol import FSW
+from fsw_dataset import ScanDataset, DATASET
+from test_scan_resume import POSITIONS
+
+fsw = FSW()
+fsw.transport = 'socket'
+fsw.ip = '127.0.0.1'
+fsw.port = int(sys.argv[1])
+fsw.init()
+fsw.configure([('SWE:POIN', 101)])
+fsw.set_path(sys.argv[2])
+fsw.dataset = ScanDataset(os.path.join(sys.argv[2], DATASET), chunk_bytes=4*4*101)
+
+def move(az, el):
+    if (az, el) == POSITIONS[6]:
+        os._exit(1)
+
+fsw.scan(POSITIONS, move)
+'''
+
+
+@pytest.fixture
+def sim():
+    sim = FSWSimulator(port=0, sweep_time=0.001, seed=1).start()
+    yield sim
+    sim.stop()
+
+
+def crash_scan(sim, path):
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', CRASH, str(sim.port), path], env=env)
+    assert result.returncode == 1
+
+
+def resume_scan(sim, path):
+    fsw = FSW()
+    fsw.transport = 'socket'
+    fsw.ip = '127.0.0.1'
+    fsw.port = sim.port
+    fsw.init()
+    fsw.configure([('SWE:POIN', 101)])
+    fsw.set_path(path)
+    fsw.open_dataset()
+    fsw.scan(POSITIONS)
+    fsw.close()
+
+
+def test_resume_dataset(sim, tmp_path, capsys):
+    crash_scan(sim, str(tmp_path))
+    assert len(read_scan(str(tmp_path))['trace']) == 4
+
+    resume_scan(sim, str(tmp_path))
+    out = capsys.readouterr().out
+    assert 'scan_0_0.txt, scan_10_0.txt' in out  # rows 4 and 5 measured again
+    assert '5 positions measured, 4 skipped' in out
+    scan = read_scan(str(tmp_path))
+    assert sorted(scan['name']) == sorted('scan_{}_{}.txt'.format(az, el) for az, el in POSITIONS)
+
+
+def test_resume_broken_dataset(sim, tmp_path, capsys):
+    crash_scan(sim, str(tmp_path))
+    with open(os.path.join(str(tmp_path), DATASET), 'r+b') as file:
+        file.write(b'\0'*512)  # header of the file destroyed
+
+    resume_scan(sim, str(tmp_path))
+    out = capsys.readouterr().out
+    assert 'cannot be read' in out
+    assert '9 positions measured, 0 skipped' in out
+    scan = read_scan(str(tmp_path))
+    assert sorted(scan['name']) == sorted('scan_{}_{}.txt'.format(az, el) for az, el in POSITIONS)
+    assert any(name.startswith(DATASET + '.broken-') for name in os.listdir(str(tmp_path)))
+
+
+@pytest.mark.parametrize('storage', ['store', 'dataset'])
+def test_position_measured_again(sim, tmp_path, monkeypatch, storage):
+    # done record of the 5th position fails: it is measured again on resume
+    complete = ScanJournal.complete
+    calls = []
+
+    def fail_once(journal, *args):
+        calls.append(args[0])
+        if len(calls) == 5:
+            raise OSError('journal lost')
+        complete(journal, *args)
+
+    monkeypatch.setattr(ScanJournal, 'complete', fail_once)
+    path = str(tmp_path)
+    for attempt in range(2):
+        fsw = FSW()
+        fsw.transport = 'socket'
+        fsw.ip = '127.0.0.1'
+        fsw.port = sim.port
+        fsw.init()
+        fsw.configure([('SWE:POIN', 101)])
+        fsw.set_path(path)
+        fsw.open_catalog()
+        if storage == 'store':
+            fsw.open_store()
+        else:
+            fsw.open_dataset()
+        try:
+            fsw.scan(POSITIONS)
+        except OSError:
+            assert attempt == 0
+        fsw.close()
+    assert calls.count(calls[4]) == 2
+
+    catalog = MeasurementCatalog(os.path.join(path, CATALOG))
+    assert len(catalog) == 9
+    catalog.close()
+    assert len(visualization.load_points(path)) == 9
+
+    # second row in the trace store / dataset, one point per position
+    os.remove(os.path.join(path, CATALOG))
+    assert len(visualization.load_points(path)) == 9
+
+
+def test_load_points_mode_both(sim, tmp_path):
+    # the store has every 3rd position, the peak table all of them
+    fsw = FSW()
+    fsw.transport = 'socket'
+    fsw.ip = '127.0.0.1'
+    fsw.port = sim.port
+    fsw.init()
+    fsw.configure([('SWE:POIN', 101)])
+    fsw.set_path(str(tmp_path))
+    fsw.open_store()
+    fsw.trace_every = 3
+    fsw.scan(POSITIONS, mode='both')
+    fsw.close()
+    assert len(visualization.load_points(str(tmp_path))) == 9